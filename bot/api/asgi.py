@@ -0,0 +1,74 @@
+import asyncio
+import logging
+
+from quart import Quart, make_response, request, jsonify
+from quart_cors import cors
+from bot.api.sse import SSE_HEADERS, format_sse
+from bot.context import get_context
+from bot.main import process_message_async, reset_conversation, rulebook_cache, stream_message_async
+from bot.models.session import InvalidSessionId, validate_session_id
+from bot.utils.metrics import CONTENT_TYPE, metrics
+
+app = cors(Quart(__name__))
+
+async def _session_id():
+    payload = await request.get_json(silent=True) or {}
+    return validate_session_id(payload.get('session_id') or request.headers.get('X-Session-Id'))
+
+@app.errorhandler(InvalidSessionId)
+async def invalid_request(error):
+    return jsonify({'error': str(error)}), 400
+
+@app.before_serving
+async def warm_up():
+    get_context().warm_up()
+
+@app.after_serving
+async def close_clients():
+    await get_context().aclose()
+
+@app.route('/chat', methods=['POST'])
+async def chat_endpoint():
+    payload = await request.get_json()
+    response = await process_message_async(payload.get('user_input'), session_id=await _session_id())
+    return jsonify({'response': response})
+
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream_endpoint():
+    payload = await request.get_json()
+    user_input = payload.get('user_input')
+    session_id = await _session_id()
+
+    async def events():
+        try:
+            async for event in stream_message_async(user_input, session_id=session_id):
+                yield format_sse(event)
+            yield format_sse({'type': 'done'})
+        except Exception:  # noqa: BLE001 - headers are already sent, report in-band
+            logging.exception("Streaming turn failed for session %s", session_id)
+            yield format_sse({'type': 'error', 'message': 'The DM lost their train of thought.'})
+
+    response = await make_response(events(), SSE_HEADERS)
+    response.timeout = None
+    return response
+
+@app.route('/chat/reset', methods=['POST'])
+async def reset_endpoint():
+    await asyncio.to_thread(reset_conversation, session_id=await _session_id())
+    return jsonify({'status': 'cleared'})
+
+@app.route('/ready', methods=['GET'])
+async def ready_endpoint():
+    status = get_context().status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+async def metrics_endpoint():
+    return metrics.render(), 200, {'Content-Type': CONTENT_TYPE}
+
+@app.route('/metrics/rulebook', methods=['GET'])
+async def rulebook_metrics_endpoint():
+    return jsonify(rulebook_cache.stats())
+
+if __name__ == '__main__':
+    app.run(port=8000, debug=True)
@@ -1,20 +1,64 @@
-from flask import Flask, request, jsonify
-from bot.main import process_message, reset_conversation
+import logging
+
+from flask import Flask, Response, request, jsonify
+from bot.api.sse import SSE_HEADERS, format_sse
+from bot.context import get_context
+from bot.main import process_message, reset_conversation, rulebook_cache, stream_message
+from bot.models.session import InvalidSessionId, validate_session_id
+from bot.utils.metrics import CONTENT_TYPE, metrics
 from flask_cors import CORS
 
 app = Flask(__name__)
 CORS(app)
+get_context().warm_up()
+
+def _session_id():
+    payload = request.get_json(silent=True) or {}
+    return validate_session_id(payload.get('session_id') or request.headers.get('X-Session-Id'))
+
+@app.errorhandler(InvalidSessionId)
+def invalid_request(error):
+    return jsonify({'error': str(error)}), 400
 
 @app.route('/chat', methods=['POST'])
 def chat_endpoint():
     user_input = request.json.get('user_input')
-    response = process_message(user_input)
+    response = process_message(user_input, session_id=_session_id())
     return jsonify({'response': response})
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    user_input = request.json.get('user_input')
+    session_id = _session_id()
+
+    def events():
+        try:
+            for event in stream_message(user_input, session_id=session_id):
+                yield format_sse(event)
+            yield format_sse({'type': 'done'})
+        except Exception:  # noqa: BLE001 - headers are already sent, report in-band
+            logging.exception("Streaming turn failed for session %s", session_id)
+            yield format_sse({'type': 'error', 'message': 'The DM lost their train of thought.'})
+
+    return Response(events(), headers=SSE_HEADERS)
+
 @app.route('/chat/reset', methods=['POST'])
 def reset_endpoint():
-    reset_conversation()
+    reset_conversation(session_id=_session_id())
     return jsonify({'status': 'cleared'})
 
+@app.route('/ready', methods=['GET'])
+def ready_endpoint():
+    status = get_context().status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/metrics/rulebook', methods=['GET'])
+def rulebook_metrics_endpoint():
+    return jsonify(rulebook_cache.stats())
+
 if __name__ == '__main__':
-    app.run(port=8000, debug=True)
+    app.run(port=8000, debug=True, threaded=True)
@@ -0,0 +1,13 @@
+import json
+
+
+def format_sse(event):
+    event_type = event.get("type", "message")
+    return f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+
+
+SSE_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
@@ -0,0 +1,45 @@
+"""Minimal local stand-in for the OpenAI Responses API.
+
+Point the bot at it with ``OPENAI_BASE_URL=http://localhost:8001/v1`` to
+load-test the servers without spending tokens. ``STUB_LATENCY_MS`` controls
+how long each request waits before answering; the replies, scripted tool
+calls and usage numbers come from ``bot.api.stub_script``.
+"""
+import os
+import json
+import asyncio
+
+from quart import Quart, make_response, request, jsonify
+
+from bot.api.stub_script import scripted_response, stream_events
+
+STUB_LATENCY_MS = float(os.getenv('STUB_LATENCY_MS', '500'))
+STUB_STREAM_DELAY_MS = float(os.getenv('STUB_STREAM_DELAY_MS', '20'))
+
+app = Quart(__name__)
+
+
+@app.route('/v1/responses', methods=['POST'])
+async def create_response():
+    payload = await request.get_json()
+    await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    response = scripted_response(payload)
+    if payload.get("stream"):
+        return await _stream(response)
+    return jsonify(response)
+
+
+async def _stream(response):
+    async def events():
+        for event_type, payload in stream_events(response):
+            if event_type == "response.output_text.delta":
+                await asyncio.sleep(STUB_STREAM_DELAY_MS / 1000)
+            yield f"event: {event_type}\ndata: {json.dumps(payload)}\n\n"
+
+    streamed = await make_response(events(), {'Content-Type': 'text/event-stream'})
+    streamed.timeout = None
+    return streamed
+
+
+if __name__ == '__main__':
+    app.run(port=int(os.getenv('STUB_PORT', '8001')))
@@ -0,0 +1,116 @@
+"""Scripted Responses API payloads shared by the HTTP stub and the benchmarks.
+
+Each player turn can open with a scripted round of tool calls
+(``STUB_TOOL_CALLS``, a JSON list of ``{"name", "arguments"}``); once the
+tool outputs come back the stub answers with ``STUB_REPLY``. Usage numbers
+are estimated from the input, with ``STUB_CACHED_RATIO`` of the input tokens
+reported as served from the prompt cache.
+"""
+import os
+import json
+import time
+import itertools
+
+STUB_REPLY = os.getenv('STUB_REPLY', 'The torchlight flickers as you step into the hall.')
+STUB_TOOL_CALLS = json.loads(os.getenv('STUB_TOOL_CALLS') or '[]')
+STUB_CACHED_RATIO = float(os.getenv('STUB_CACHED_RATIO', '0'))
+
+_ids = itertools.count(1)
+
+
+def _usage(input_tokens, output_tokens, cached_ratio):
+    return {
+        "input_tokens": input_tokens,
+        "input_tokens_details": {"cached_tokens": int(input_tokens * cached_ratio)},
+        "output_tokens": output_tokens,
+        "output_tokens_details": {"reasoning_tokens": 0},
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+def build_response(model, text, input_tokens=0, tool_calls=(), cached_ratio=0.0):
+    response_id = next(_ids)
+    output = [
+        {
+            "type": "function_call",
+            "id": f"fc_stub_{response_id}_{index}",
+            "call_id": f"call_stub_{response_id}_{index}",
+            "name": call["name"],
+            "arguments": call["arguments"] if isinstance(call["arguments"], str) else json.dumps(call["arguments"]),
+            "status": "completed",
+        }
+        for index, call in enumerate(tool_calls)
+    ]
+    if text:
+        output.append(
+            {
+                "type": "message",
+                "id": f"msg_stub_{response_id}",
+                "role": "assistant",
+                "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        )
+    output_tokens = len(text.split()) + sum(len(item.get("arguments", "")) // 4 for item in output)
+    return {
+        "id": f"resp_stub_{response_id}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": "completed",
+        "output": output,
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": _usage(input_tokens, output_tokens, cached_ratio),
+    }
+
+
+def estimate_input_tokens(input_items):
+    return sum(
+        len(str(item.get("content") or item.get("output") or item.get("arguments") or "").split())
+        for item in input_items
+        if isinstance(item, dict)
+    )
+
+
+def scripted_response(payload, reply=STUB_REPLY, tool_calls=STUB_TOOL_CALLS, cached_ratio=STUB_CACHED_RATIO):
+    """Answer a ``responses.create`` payload following the script."""
+    input_items = payload.get("input") or []
+    # A turn opens with a user message; after tool outputs, the turn is wrapped up in prose.
+    # Trailing system messages, such as the party-state block, come after the user message.
+    last = next(
+        (item for item in reversed(input_items) if not (isinstance(item, dict) and item.get("role") == "system")),
+        {},
+    )
+    opens_turn = isinstance(last, dict) and last.get("role") == "user"
+    return build_response(
+        payload.get("model") or "stub",
+        "" if opens_turn and tool_calls else reply,
+        estimate_input_tokens(input_items),
+        tool_calls if opens_turn else (),
+        cached_ratio,
+    )
+
+
+def stream_events(response):
+    """Yield ``(event_type, payload)`` pairs streaming ``response`` one word at a time."""
+    sequence = itertools.count()
+
+    def event(event_type, **fields):
+        return event_type, {"type": event_type, "sequence_number": next(sequence), **fields}
+
+    yield event("response.created", response={**response, "status": "in_progress", "output": []})
+    for output_index, item in enumerate(response["output"]):
+        if item["type"] != "message":
+            continue
+        words = item["content"][0]["text"].split(" ")
+        for index, word in enumerate(words):
+            yield event(
+                "response.output_text.delta",
+                item_id=item["id"],
+                output_index=output_index,
+                content_index=0,
+                delta=word if index == 0 else f" {word}",
+            )
+    yield event("response.completed", response=response)
@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import threading
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
+
+load_dotenv()
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '1000'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '100'))
+RULEBOOK_VALIDATION_TTL_SECONDS = float(os.getenv('RULEBOOK_VALIDATION_TTL_SECONDS', '3600'))
+RULEBOOK_RETRY_SECONDS = float(os.getenv('RULEBOOK_RETRY_SECONDS', '30'))
+
+
+class AppContext:
+    """Process-wide resources, created on first use instead of at import.
+
+    Holds the shared OpenAI clients and the rulebook readiness state. The
+    rulebook is validated (and rebuilt if needed) by a background warm-up
+    thread; the result is cached for ``RULEBOOK_VALIDATION_TTL_SECONDS`` and
+    refreshed in the background once it goes stale. A failed first warm-up
+    is not retried for ``RULEBOOK_RETRY_SECONDS``; callers fail fast meanwhile.
+    """
+
+    def __init__(self, validation_ttl=RULEBOOK_VALIDATION_TTL_SECONDS, retry_seconds=RULEBOOK_RETRY_SECONDS):
+        self.validation_ttl = validation_ttl
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._ready = threading.Event()
+        self._warm_up_thread = None
+        self._vector_store_id = None
+        self._version = None
+        self._validated_at = None
+        self._checked_at = None
+        self._error = None
+        self._failed_at = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAI()
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    # One pooled HTTP client shared by every in-flight async turn in the process.
+                    self._async_client = AsyncOpenAI(
+                        http_client=DefaultAsyncHttpxClient(
+                            limits=httpx.Limits(
+                                max_connections=OPENAI_MAX_CONNECTIONS,
+                                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                            )
+                        )
+                    )
+        return self._async_client
+
+    def use_clients(self, client, async_client=None):
+        """Replace the OpenAI clients, e.g. with an in-process fake for benchmarks."""
+        with self._lock:
+            self._client = client
+            self._async_client = async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+
+    def warm_up(self):
+        """Start validating the rulebook in the background; returns immediately."""
+        with self._lock:
+            if self._warm_up_thread is not None and self._warm_up_thread.is_alive():
+                return self._warm_up_thread
+            self._warm_up_thread = threading.Thread(target=self._prepare, name="warm-up", daemon=True)
+            self._warm_up_thread.start()
+            return self._warm_up_thread
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def status(self):
+        return {
+            "ready": self.is_ready(),
+            "vector_store_id": self._vector_store_id,
+            "validated_seconds_ago": None if self._validated_at is None else round(time.monotonic() - self._validated_at, 1),
+            "error": self._error,
+        }
+
+    def vector_store_id(self, timeout=None):
+        """Return the validated vector store ID, waiting for warm-up on first use."""
+        if not self._ready.is_set():
+            failed_at = self._failed_at
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_seconds:
+                raise RuntimeError(self._error)
+            self.warm_up().join(timeout)
+            if not self._ready.is_set():
+                raise RuntimeError(self._error or "Rulebook is still warming up.")
+        elif time.monotonic() - self._checked_at > self.validation_ttl:
+            self.warm_up()
+        return self._vector_store_id
+
+    def rulebook_version(self, timeout=None):
+        """Return ``(vector_store_id, content_hash)`` for the last validated rulebook.
+
+        Syncing changed rulebook files in place keeps the vector store ID, so
+        the content hash is what tells cached answers apart.
+        """
+        self.vector_store_id(timeout)
+        return self._version
+
+    def _prepare(self):
+        from bot.setup import initialize_rulebook, rulebook_content_hash
+        from bot.models.conversation import _get_encoding
+
+        try:
+            _get_encoding()
+            vector_store_id = initialize_rulebook()
+            self._version = (vector_store_id, rulebook_content_hash())
+            self._vector_store_id = vector_store_id
+            self._validated_at = time.monotonic()
+            self._error = None
+            self._failed_at = None
+            # Set before _ready: callers released by it compare against _checked_at.
+            self._checked_at = self._validated_at
+            self._ready.set()
+            logging.info("Rulebook ready (vector store %s)", self._vector_store_id)
+        except Exception as exc:  # noqa: BLE001 - surfaced through status() and the readiness endpoint
+            self._error = f"{type(exc).__name__}: {exc}"
+            self._failed_at = time.monotonic()
+            logging.exception("Rulebook warm-up failed")
+        finally:
+            self._checked_at = time.monotonic()
+
+
+_context = None
+_context_lock = threading.Lock()
+
+
+def get_context() -> AppContext:
+    global _context
+    if _context is None:
+        with _context_lock:
+            if _context is None:
+                _context = AppContext()
+    return _context
+
+
+def get_client() -> OpenAI:
+    return get_context().client
+
+
+def get_async_client() -> AsyncOpenAI:
+    return get_context().async_client
@@ -1,49 +1,124 @@
 import os
+import asyncio
 import logging
 import json
 
 from dotenv import load_dotenv
 from tenacity import retry, wait_random_exponential, stop_after_attempt
-from openai import OpenAI
 
+from bot.context import get_async_client, get_client, get_context
+from bot.models import autosave, rules
 from bot.models.character import Character
+from bot.models.character_store import CharacterRepository
 from bot.utils.chat import (
+    async_chat_completion_request,
+    async_stream_chat_completion_request,
     chat_completion_request,
     extract_function_calls,
     extract_response_text,
+    final_stream_response,
+    stream_chat_completion_request,
 )
-from bot.setup import initialize_bot
-from bot.models.conversation import Conversation
+from bot.setup import RULEBOOK_MODE, SYSTEM_MESSAGE
+from bot.models.conversation import CHARACTER_TOOLS, Conversation
+from bot.models.session import DEFAULT_SESSION_ID, SessionManager
+from bot.models.storage import GAME, RecordNotFound, get_storage
+from bot.utils import dice, encounter
+from bot.utils.executor import CONVERSATION_RESOURCE, run_tool_calls, run_tool_calls_async
+from bot.utils.functions import FUNCTIONS
+from bot.utils.logs import Payload, configure_logging, payload_logger
+from bot.utils.rulebook_cache import RulebookCache
+from bot.utils.rulebook_index import format_passages, get_rulebook_index, index_exists
+from bot.utils.metrics import metrics, turn_span
+from bot.utils.routing import CHARACTER, NARRATION, RULES, router
+from bot.utils.tools import ToolError, ToolRegistry
 
 load_dotenv()  # take environment variables from .env.
 
-GPT_MODEL = os.getenv('GPT_MODEL')
-VECTOR_STORE_ID = None
+# "delta" answers update_character with only the changed fields; "full" returns the whole sheet.
+CHARACTER_UPDATE_RESPONSE = os.getenv('CHARACTER_UPDATE_RESPONSE', 'delta').lower()
 
-logging.basicConfig(
-    filename='../logs/debug.log',
-    level=logging.DEBUG,
-    format='%(asctime)s:%(levelname)s:%(message)s',
-    datefmt='%H:%M:%S'
-)
+# Upper bound on rolls per roll_dice call, and fights per simulate_encounter call by default.
+MAX_DICE_ROLLS = 100
+ENCOUNTER_TRIALS = int(os.getenv('ENCOUNTER_TRIALS', '2000'))
+# "on" sends the party's current HP, slots, XP and conditions with every request.
+PARTY_STATE = os.getenv('PARTY_STATE', 'on').lower() != 'off'
+
+configure_logging()
+
+rulebook_cache = RulebookCache()
+characters = CharacterRepository()
+
+RULEBOOK_SYSTEM_PROMPT = "You are a Dungeons & Dragons rule expert. Answer questions using the provided rulebook resources and quote rules when helpful."
+
+def _wait_for_rulebook():
+    # Blocks only until the first background warm-up has validated the rulebook.
+    # A built local index is read straight from disk and needs no vector store.
+    if RULEBOOK_MODE == "local" and index_exists():
+        return None
+    return get_context().vector_store_id()
 
-client = OpenAI()
+def _rulebook_request_kwargs(question, model, reasoning):
+    vector_store_id = _wait_for_rulebook()
+    kwargs = {"model": model}
+    if reasoning:
+        kwargs["reasoning"] = reasoning
+    else:
+        kwargs["temperature"] = .5
+    if RULEBOOK_MODE == "local":
+        # Retrieve passages from the local index and inline them, skipping remote file_search.
+        excerpts = format_passages(get_rulebook_index().search(question))
+        kwargs["input"] = [
+            {"role": "system", "content": RULEBOOK_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Rulebook excerpts:\n{excerpts}\n\nQuestion: {question}"},
+        ]
+        return kwargs
+    if not vector_store_id:
+        raise RuntimeError("Vector store has not been initialized.")
+    kwargs["input"] = [
+        {"role": "system", "content": RULEBOOK_SYSTEM_PROMPT},
+        {"role": "user", "content": question},
+    ]
+    kwargs["tools"] = [{"type": "file_search", "vector_store_ids": [vector_store_id]}]
+    return kwargs
+
+def _rulebook_cache_namespace(model):
+    # A rebuilt vector store has a new ID, but a sync swaps changed files in place and
+    # keeps it, so the content hash of the rulebooks is part of the namespace too.
+    # The local index fingerprint already covers its contents.
+    if RULEBOOK_MODE == "local":
+        return (get_rulebook_index().fingerprint, model)
+    return (*get_context().rulebook_version(), model)
+
+@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+def _ask_rulebook(question, model, reasoning):
+    kwargs = _rulebook_request_kwargs(question, model, reasoning)
+    with router.timed(RULES, model):
+        response = get_client().responses.create(**kwargs)
+    return extract_response_text(response)
 
 @retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+async def _ask_rulebook_async(question, model, reasoning):
+    kwargs = _rulebook_request_kwargs(question, model, reasoning)
+    with router.timed(RULES, model):
+        response = await get_async_client().responses.create(**kwargs)
+    return extract_response_text(response)
+
 def consult_rulebook(question):
-    if not VECTOR_STORE_ID:
-        raise RuntimeError("Vector store has not been initialized.")
-    response = client.responses.create(
-        model=GPT_MODEL,
-        input=[
-            {"role": "system", "content": "You are a Dungeons & Dragons rule expert. Answer questions using the provided rulebook resources and quote rules when helpful."},
-            {"role": "user", "content": question},
-        ],
-        tools=[{"type": "file_search"}],
-        tool_resources={"file_search": {"vector_store_ids": [VECTOR_STORE_ID]}},
-        temperature=.5,
+    # The model is picked once per question, so retries use it too and the answer
+    # is cached under the model that actually gave it.
+    model, reasoning = router.select(RULES)
+    return rulebook_cache.get_or_compute(
+        _rulebook_cache_namespace(model), question, lambda: _ask_rulebook(question, model, reasoning)
+    )
+
+async def consult_rulebook_async(question):
+    if not get_context().is_ready():
+        await asyncio.to_thread(_wait_for_rulebook)
+    model, reasoning = router.select(RULES)
+    return await rulebook_cache.get_or_compute_async(
+        _rulebook_cache_namespace(model), question, lambda: _ask_rulebook_async(question, model, reasoning)
     )
-    return extract_response_text(response)
 
 def create_and_save_character(
     name, 
@@ -71,6 +146,13 @@ def create_and_save_character(
     features_and_traits,
     notes
 ):
+    # Numbers the class tables decide are derived here rather than trusted from the model
+    proficiency_bonus = rules.proficiency_bonus(level)
+    hit_dice = rules.hit_dice(character_class, level)
+    experience_points = max(experience_points or 0, rules.experience_for_level(level))
+    if max_hit_points is None:
+        max_hit_points = rules.max_hit_points(character_class, level, constitution)
+
     # Create a new character
     new_character = Character(
         name=name,
@@ -99,30 +181,66 @@ def create_and_save_character(
         notes=notes
     )
     
-    # Save the character to a JSON file
-    new_character.save(f"characters/{name}_character.json")
+    # Cache the character; the repository writes it to disk in the background
+    characters.add(new_character)
     
     # Return the new character
-    return json.dumps(new_character.__dict__, indent=4)
+    return new_character.to_json(indent=4)
 
 def get_character_state(name):
-    character = Character.load(name)
+    character = characters.get(name)
 
-    return json.dumps(character.__dict__)
+    return character.to_json()
 
 def load_game(name):
-    filename = f"data/saved_games/{name}_game.json"
-    with open(filename, 'r') as f:
-        messages = json.load(f)
-    
-    return messages
+    try:
+        return get_storage().load_messages(GAME, name)
+    except RecordNotFound:
+        # No explicit save under that name: fall back to a session's autosave.
+        return autosave.restore(name)
 
-def save_game(name, messages):
-    filename = f"saved_games/{name}_game.json"
-    with open(filename, 'w') as f:
-        json.dump(messages, f)
+def lookup_class_rules(character_class, level=None, experience_points=None):
+    try:
+        return json.dumps(rules.class_rules(character_class, level, experience_points))
+    except ValueError as exc:
+        raise ToolError(str(exc), "invalid_arguments") from exc
+
+def roll_dice(expression, times=None, mode=None):
+    times = times or 1
+    if not 1 <= times <= MAX_DICE_ROLLS:
+        raise ToolError(f"times must be between 1 and {MAX_DICE_ROLLS}", "invalid_arguments")
+    try:
+        results = dice.roll(expression, times, mode or dice.NORMAL)
+    except ValueError as exc:
+        raise ToolError(str(exc), "invalid_arguments") from exc
+    return json.dumps({"expression": expression, "mode": mode or dice.NORMAL, "results": results.tolist()})
+
+def simulate_encounter(party, monsters, trials=None):
+    combatants = [
+        encounter.character_combatant(
+            characters.get(member["name"]),
+            armor_class=member.get("armor_class"),
+            attack_bonus=member.get("attack_bonus"),
+            damage=member.get("damage"),
+        )
+        for member in party
+    ]
+    try:
+        for monster in monsters:
+            combatants.extend(encounter.monster_combatants(monster))
+            if len(combatants) > encounter.MAX_COMBATANTS:
+                raise ValueError(f"An encounter can have at most {encounter.MAX_COMBATANTS} combatants")
+        return json.dumps(encounter.simulate(combatants, trials or ENCOUNTER_TRIALS))
+    except ValueError as exc:
+        raise ToolError(str(exc), "invalid_arguments") from exc
+
+def save_game(conversation, name):
+    # With the SQLite backend only messages added since the last save are written.
+    epoch, generation, messages = conversation.snapshot()
+    storage = get_storage()
+    storage.save_messages(GAME, name, messages, generation, epoch)
     
-    return f"Game saved in {filename}"
+    return f"Game saved in {storage.transcript_location(GAME, name)}"
 
 def update_character(
         name,
@@ -130,119 +248,321 @@ def update_character(
         additional_death_saves_successes=None,
         additional_death_saves_failures=None,
         delta_hit_points=None,
-        additional_level_1_spell_slots_used=None
+        additional_level_1_spell_slots_used=None,
+        add_conditions=None,
+        remove_conditions=None
 ):
-    character = Character.load(name)
-
-    if additional_experience_points is not None:
-        experience_points = character.experience_points
-        character.experience_points = experience_points + additional_experience_points
-    if additional_death_saves_successes is not None:
-        death_saves_successes = character.death_saves["successes"]
-        character.death_saves["successes"] = death_saves_successes + additional_death_saves_successes
-    if additional_death_saves_failures is not None:
-        death_saves_failures = character.death_saves["failures"]
-        character.death_saves["failures"] = death_saves_failures + additional_death_saves_failures
-    if delta_hit_points is not None:
-        current_hit_points = character.current_hit_points
-        character.current_hit_points = current_hit_points + delta_hit_points
-    if additional_level_1_spell_slots_used is not None:
-        spells_slots_level_1_used = character.spells_slots_level_1_used
-        character.spells_slots_level_1_used = spells_slots_level_1_used + additional_level_1_spell_slots_used
-
-    character.save(f"characters/{name}_character.json")
-    return json.dumps(character.__dict__)
-
-conversation, VECTOR_STORE_ID = initialize_bot()
-SYSTEM_MESSAGE = conversation.messages[0]["content"]
-
-
-def reset_conversation():
-    global conversation
-    conversation = Conversation(SYSTEM_MESSAGE)
-    logging.debug("Conversation context reset by user action.")
-
-def process_message(user_input):
+    with characters.edit(name) as character:
+        changed = character.apply_delta({
+            "experience_points": additional_experience_points,
+            "death_saves.successes": additional_death_saves_successes,
+            "death_saves.failures": additional_death_saves_failures,
+            "current_hit_points": delta_hit_points,
+            "spells_slots_level_1_used": additional_level_1_spell_slots_used,
+        })
+        if additional_experience_points:
+            changed.update(character.apply_level_ups())
+        changed.update(character.update_conditions(add_conditions, remove_conditions))
+        if CHARACTER_UPDATE_RESPONSE == "full":
+            return character.to_json()
+        return json.dumps({"name": character.name, "changed": changed})
+
+sessions = SessionManager(lambda: Conversation(SYSTEM_MESSAGE))
+
+def _collect_metrics():
+    stats = rulebook_cache.stats()
+    return {
+        "dmbot_active_sessions": ("gauge", "Sessions held in memory.", len(sessions)),
+        "dmbot_rulebook_cache_entries": ("gauge", "Cached rulebook answers.", stats["entries"]),
+        "dmbot_rulebook_cache_hits_total": ("counter", "Exact rulebook cache hits.", stats["hits"]),
+        "dmbot_rulebook_cache_near_hits_total": ("counter", "Rulebook cache hits on a reworded question.", stats["near_hits"]),
+        "dmbot_rulebook_cache_misses_total": ("counter", "Rulebook questions sent to the model.", stats["misses"]),
+        "dmbot_rulebook_cache_latency_saved_seconds_total": (
+            "counter", "Model latency avoided by rulebook cache hits.", stats["latency_saved_seconds"]
+        ),
+    }
+
+metrics.register_collector(_collect_metrics)
+
+
+def reset_conversation(session_id=DEFAULT_SESSION_ID):
+    sessions.reset(session_id)
+    logging.debug("Conversation context for session %s reset by user action.", session_id)
+
+def process_message(user_input, session_id=DEFAULT_SESSION_ID):
+    with sessions.session(session_id) as conversation, turn_span("sync") as span:
+        return _process_turn(conversation, user_input, span)
+
+def _process_turn(conversation, user_input, span):
     conversation.add_user_message(user_input)
-    chat_response = chat_completion_request(conversation.get_messages())
+    chat_response = _model_round(conversation, NARRATION)
     conversation.add_assistant_response(chat_response)
-    logging.debug(conversation.get_messages())
+    span.add_response(chat_response)
+    payload_logger.debug("Conversation after model response: %s", Payload(conversation.get_messages))
 
     assistant_message = extract_response_text(chat_response)
     tool_calls = extract_function_calls(chat_response)
 
     while tool_calls:
-        for call in tool_calls:
-            function_name = call["name"]
-            call_id = call["call_id"]
-            arguments = call.get("arguments") or "{}"
-            try:
-                function_args = json.loads(arguments)
-            except json.JSONDecodeError:
-                function_args = {}
-
-            # Get the response from the function and add it to the conversation context
-            if function_name == "consult_rulebook":
-                function_response = consult_rulebook(
-                    question=function_args.get("question"),
-                )
-            elif function_name == "create_and_save_character":
-                function_response = create_and_save_character(
-                    name=function_args.get("name"),
-                    character_class=function_args.get("character_class"),
-                    race=function_args.get("race"),
-                    level=function_args.get("level"),
-                    background=function_args.get("background"),
-                    alignment=function_args.get("alignment"),
-                    experience_points=function_args.get("experience_points"),
-                    strength=function_args.get("strength"),
-                    dexterity=function_args.get("dexterity"),
-                    constitution=function_args.get("constitution"),
-                    wisdom=function_args.get("wisdom"),
-                    intelligence=function_args.get("intelligence"),
-                    charisma=function_args.get("charisma"),
-                    proficiency_bonus=function_args.get("proficiency_bonus"),
-                    skills=function_args.get("skills"),
-                    saving_throws=function_args.get("saving_throws"),
-                    max_hit_points=function_args.get("max_hit_points"),
-                    hit_dice=function_args.get("hit_dice"),
-                    death_saves=function_args.get("death_saves"),
-                    equipment=function_args.get("equipment"),
-                    spells=function_args.get("spells"),
-                    languages=function_args.get("languages"),
-                    features_and_traits=function_args.get("features_and_traits"),
-                    notes=function_args.get("notes")
-                )
-            elif function_name == "update_character":
-                function_response = update_character(
-                    name=function_args.get("name"),
-                    additional_experience_points=function_args.get("additional_experience_points"),
-                    additional_death_saves_successes=function_args.get("additional_death_saves_successes"),
-                    additional_death_saves_failures=function_args.get("additional_death_saves_failures"),
-                    delta_hit_points=function_args.get("delta_hit_points"),
-                    additional_level_1_spell_slots_used=function_args.get("additional_level_1_spell_slots_used"),
-                )
-            elif function_name == "load_game":
-                name = function_args.get("name")
-                conversation.messages = load_game(name)
-                function_response = f"The game for {name} was stopped by the user after the prior save. Everything worked perfectly and now it has now been successfully reloaded. Respond with a summary of what hsa happened and the user will pick the game back up."
-            elif function_name == "save_game":
-                function_response = save_game(function_args.get("name"), conversation.messages)
-            elif function_name == "get_character_state":
-                function_response = get_character_state(function_args.get("name"))
-            else:
-                function_response = None
-
-            if function_response is not None:
-                conversation.add_function_message(
-                    function_name=function_name,
-                    call_id=call_id,
-                    function_response=function_response,
-                )
-
-        chat_response = chat_completion_request(conversation.get_messages())
+        span.add_tool_calls(len(tool_calls))
+        _run_tools(conversation, tool_calls)
+
+        chat_response = _model_round(conversation, _round_route(tool_calls))
         conversation.add_assistant_response(chat_response)
+        span.add_response(chat_response)
         assistant_message = extract_response_text(chat_response)
         tool_calls = extract_function_calls(chat_response)
 
     return assistant_message or ""
+
+async def process_message_async(user_input, session_id=DEFAULT_SESSION_ID):
+    async with sessions.session_async(session_id) as conversation:
+        with turn_span("async") as span:
+            return await _process_turn_async(conversation, user_input, span)
+
+async def _process_turn_async(conversation, user_input, span):
+    conversation.add_user_message(user_input)
+    chat_response = await _model_round_async(conversation, NARRATION)
+    conversation.add_assistant_response(chat_response)
+    span.add_response(chat_response)
+
+    assistant_message = extract_response_text(chat_response)
+    tool_calls = extract_function_calls(chat_response)
+
+    while tool_calls:
+        span.add_tool_calls(len(tool_calls))
+        await _run_tools_async(conversation, tool_calls)
+
+        chat_response = await _model_round_async(conversation, _round_route(tool_calls))
+        conversation.add_assistant_response(chat_response)
+        span.add_response(chat_response)
+        assistant_message = extract_response_text(chat_response)
+        tool_calls = extract_function_calls(chat_response)
+
+    return assistant_message or ""
+
+def stream_message(user_input, session_id=DEFAULT_SESSION_ID):
+    """Yield ``delta`` and ``tool_call`` events for a turn as the model produces them."""
+    with sessions.session(session_id) as conversation, turn_span("stream") as span:
+        conversation.add_user_message(user_input)
+        emitted_text = False
+        route = NARRATION
+        while True:
+            chat_response = None
+            new_round = True
+            for event in _stream_round(conversation, route):
+                if event.type == "response.output_text.delta":
+                    if new_round and emitted_text:
+                        yield {"type": "delta", "text": "\n\n"}
+                    new_round = False
+                    emitted_text = True
+                    yield {"type": "delta", "text": event.delta}
+                else:
+                    chat_response = final_stream_response(event) or chat_response
+            if chat_response is None:
+                raise RuntimeError("Responses API stream ended without a final response.")
+
+            conversation.add_assistant_response(chat_response)
+            span.add_response(chat_response)
+            tool_calls = extract_function_calls(chat_response)
+            if not tool_calls:
+                return
+            span.add_tool_calls(len(tool_calls))
+            for call in tool_calls:
+                yield {"type": "tool_call", "name": call["name"]}
+            _run_tools(conversation, tool_calls)
+            route = _round_route(tool_calls)
+
+async def stream_message_async(user_input, session_id=DEFAULT_SESSION_ID):
+    async with sessions.session_async(session_id) as conversation:
+        with turn_span("async_stream") as span:
+            conversation.add_user_message(user_input)
+            emitted_text = False
+            route = NARRATION
+            while True:
+                chat_response = None
+                new_round = True
+                async for event in _stream_round_async(conversation, route):
+                    if event.type == "response.output_text.delta":
+                        if new_round and emitted_text:
+                            yield {"type": "delta", "text": "\n\n"}
+                        new_round = False
+                        emitted_text = True
+                        yield {"type": "delta", "text": event.delta}
+                    else:
+                        chat_response = final_stream_response(event) or chat_response
+                if chat_response is None:
+                    raise RuntimeError("Responses API stream ended without a final response.")
+
+                conversation.add_assistant_response(chat_response)
+                span.add_response(chat_response)
+                tool_calls = extract_function_calls(chat_response)
+                if not tool_calls:
+                    return
+                span.add_tool_calls(len(tool_calls))
+                for call in tool_calls:
+                    yield {"type": "tool_call", "name": call["name"]}
+                await _run_tools_async(conversation, tool_calls)
+                route = _round_route(tool_calls)
+
+def _load_game_tool(conversation, name):
+    conversation.replace_messages(load_game(name))
+    return f"The game for {name} was stopped by the user after the prior save. Everything worked perfectly and now it has now been successfully reloaded. Respond with a summary of what hsa happened and the user will pick the game back up."
+
+def _round_route(tool_calls):
+    # The round that only answers character tools (creation, updates, lookups) can use a cheaper model.
+    if all(call["name"] in CHARACTER_TOOLS for call in tool_calls):
+        return CHARACTER
+    return NARRATION
+
+def _character_resource(arguments):
+    return {f"character:{arguments.get('name')}"}
+
+def _party_resource(arguments):
+    return {f"character:{member['name']}" for member in arguments.get("party") or ()}
+
+def _conversation_resource(arguments):
+    return {CONVERSATION_RESOURCE}
+
+# Calls sharing a resource run one after another; everything else runs concurrently.
+tools = ToolRegistry(FUNCTIONS)
+tools.register("consult_rulebook", consult_rulebook, async_handler=consult_rulebook_async)
+tools.register("create_and_save_character", create_and_save_character, resources=_character_resource)
+tools.register("update_character", update_character, resources=_character_resource)
+tools.register("get_character_state", get_character_state, resources=_character_resource)
+tools.register("lookup_class_rules", lookup_class_rules)
+tools.register("roll_dice", roll_dice)
+tools.register("simulate_encounter", simulate_encounter, resources=_party_resource)
+tools.register("load_game", _load_game_tool, resources=_conversation_resource, needs_conversation=True)
+tools.register("save_game", save_game, resources=_conversation_resource, needs_conversation=True)
+
+def _run_tools(conversation, tool_calls):
+    responses = run_tool_calls(
+        [tools.parse(call) for call in tool_calls],
+        lambda parsed: tools.execute(parsed, conversation),
+        tools.resources,
+    )
+    for call, function_response in zip(tool_calls, responses):
+        _record_tool_output(conversation, call, function_response)
+
+async def _run_tools_async(conversation, tool_calls):
+    responses = await run_tool_calls_async(
+        [tools.parse(call) for call in tool_calls],
+        lambda parsed: tools.execute_async(parsed, conversation),
+        tools.resources,
+    )
+    for call, function_response in zip(tool_calls, responses):
+        _record_tool_output(conversation, call, function_response)
+
+def _request_input(conversation):
+    # Pre-flight: compact before sending rather than after the provider reports an oversized request.
+    conversation.ensure_within_budget()
+    return conversation.request_input(_party_state(conversation))
+
+async def _request_input_async(conversation):
+    if conversation.over_budget():
+        await asyncio.to_thread(conversation.ensure_within_budget)
+    # A character not yet cached is read from storage, so this stays off the event loop.
+    party_state = await asyncio.to_thread(_party_state, conversation) if PARTY_STATE else None
+    return conversation.request_input(party_state)
+
+def _party_state(conversation):
+    # Read from the repository cache on every request, so changes made by this turn's tools are included.
+    if not PARTY_STATE:
+        return None
+    lines = []
+    for name in list(conversation.party):
+        try:
+            lines.append(characters.get(name).status_line())
+        except LookupError:
+            # Named in a call that failed, e.g. a misspelling; stop looking it up.
+            conversation.forget_party_member(name)
+        except Exception:  # noqa: BLE001 - a partial block would be worse than none; the turn goes on
+            logging.exception("Unable to read %s for the party state; sending none", name)
+            return None
+    return "\n".join(lines) or None
+
+def _restart_chain(conversation):
+    # The stored response may have expired or been deleted; start a new chain from the full history.
+    logging.warning("Chained request failed for %s; resending the full history", conversation.cache_key)
+    conversation.reset_chain()
+
+def _model_round(conversation, route):
+    input_items, previous_response_id = _request_input(conversation)
+    try:
+        return chat_completion_request(
+            input_items,
+            prompt_cache_key=conversation.cache_key,
+            route=route,
+            previous_response_id=previous_response_id,
+        )
+    except Exception:
+        if previous_response_id is None:
+            raise
+        _restart_chain(conversation)
+        input_items, _ = _request_input(conversation)
+        return chat_completion_request(input_items, prompt_cache_key=conversation.cache_key, route=route)
+
+async def _model_round_async(conversation, route):
+    input_items, previous_response_id = await _request_input_async(conversation)
+    try:
+        return await async_chat_completion_request(
+            input_items,
+            prompt_cache_key=conversation.cache_key,
+            route=route,
+            previous_response_id=previous_response_id,
+        )
+    except Exception:
+        if previous_response_id is None:
+            raise
+        _restart_chain(conversation)
+        input_items, _ = await _request_input_async(conversation)
+        return await async_chat_completion_request(input_items, prompt_cache_key=conversation.cache_key, route=route)
+
+def _stream_round(conversation, route):
+    input_items, previous_response_id = _request_input(conversation)
+    events = stream_chat_completion_request(
+        input_items, prompt_cache_key=conversation.cache_key, route=route, previous_response_id=previous_response_id
+    )
+    if previous_response_id is not None:
+        # A rejected chain fails before the first event, so nothing has reached the player yet.
+        try:
+            first_event = next(events)
+        except StopIteration:
+            return
+        except Exception:
+            _restart_chain(conversation)
+            input_items, _ = _request_input(conversation)
+            events = stream_chat_completion_request(input_items, prompt_cache_key=conversation.cache_key, route=route)
+        else:
+            yield first_event
+    yield from events
+
+async def _stream_round_async(conversation, route):
+    input_items, previous_response_id = await _request_input_async(conversation)
+    events = async_stream_chat_completion_request(
+        input_items, prompt_cache_key=conversation.cache_key, route=route, previous_response_id=previous_response_id
+    )
+    if previous_response_id is not None:
+        try:
+            first_event = await anext(events)
+        except StopAsyncIteration:
+            return
+        except Exception:
+            _restart_chain(conversation)
+            input_items, _ = await _request_input_async(conversation)
+            events = async_stream_chat_completion_request(
+                input_items, prompt_cache_key=conversation.cache_key, route=route
+            )
+        else:
+            yield first_event
+    async for event in events:
+        yield event
+
+def _record_tool_output(conversation, call, function_response):
+    if function_response is not None:
+        conversation.add_function_message(
+            function_name=call["name"],
+            call_id=call["call_id"],
+            function_response=function_response,
+        )
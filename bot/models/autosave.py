@@ -0,0 +1,181 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from bot.models.character import write_json_atomic
+from bot.models.storage import RecordNotFound
+
+load_dotenv()
+
+AUTOSAVE_ENABLED = os.getenv('AUTOSAVE', '0').lower() in ('1', 'true', 'yes')
+AUTOSAVE_DIR = Path(os.getenv('AUTOSAVE_DIR', 'data/autosave'))
+# Messages appended to the log before it is folded into a fresh snapshot.
+AUTOSAVE_SNAPSHOT_EVERY = int(os.getenv('AUTOSAVE_SNAPSHOT_EVERY', '200'))
+
+
+# One writer thread does the file I/O for every log, in the order it was queued,
+# so callers only pay for working out what changed.
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _submit(task):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="autosave-writer", daemon=True)
+                _writer.start()
+    _queue.put(task)
+
+
+def _write_loop():
+    while True:
+        task = _queue.get()
+        try:
+            task()
+        except Exception:  # noqa: BLE001 - the writer thread must outlive a failed write
+            logging.exception("Autosave failed")
+
+
+def flush():
+    """Block until every queued autosave write has reached the disk."""
+    if _writer is None:
+        return
+    done = threading.Event()
+    _queue.put(done.set)
+    done.wait()
+
+
+atexit.register(flush)
+
+
+def _snapshot_path(directory, name):
+    return Path(directory) / f"{name}.snapshot.json"
+
+
+def _log_path(directory, name):
+    return Path(directory) / f"{name}.log"
+
+
+class AutosaveLog:
+    """Crash-safe autosave for one conversation: a snapshot plus an append-only log.
+
+    Each message added to the conversation is appended to the log as one JSON
+    line tagged with the conversation generation and its index. The snapshot
+    is rewritten (and the log truncated) when the generation changes, i.e.
+    after a summary, trim or reload, and after every ``snapshot_every``
+    appended messages, so the log never grows without bound. The writes
+    themselves are queued for the autosave writer thread.
+    """
+
+    def __init__(self, name, directory=AUTOSAVE_DIR, snapshot_every=AUTOSAVE_SNAPSHOT_EVERY):
+        self.name = name
+        self.directory = Path(directory)
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._file = None
+        self._generation = None
+        self._logged = 0
+        self._since_snapshot = 0
+
+    def sync(self, generation, messages):
+        """Queue whatever changed in ``messages`` since the previous call for writing."""
+        # Messages are never changed once added, so the writer can serialize them later.
+        with self._lock:
+            if (
+                generation != self._generation
+                or len(messages) < self._logged
+                or self._since_snapshot >= self.snapshot_every
+            ):
+                snapshot = list(messages)
+                self._generation = generation
+                self._logged = len(snapshot)
+                self._since_snapshot = 0
+                _submit(lambda: self._write(self._snapshot, generation, snapshot))
+                return
+            if len(messages) == self._logged:
+                return
+            entries = [(index, messages[index]) for index in range(self._logged, len(messages))]
+            self._since_snapshot += len(entries)
+            self._logged = len(messages)
+            _submit(lambda: self._write(self._append, generation, entries))
+
+    def close(self):
+        with self._lock:
+            _submit(self._close_file)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _log(self):
+        if self._file is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._file = open(_log_path(self.directory, self.name), 'a')
+        return self._file
+
+    def _write(self, write, *args):
+        # Runs on the writer thread. After a failed write the next sync starts over with a snapshot.
+        try:
+            write(*args)
+        except Exception:
+            with self._lock:
+                self._generation = None
+            raise
+
+    def _append(self, generation, entries):
+        self._log().write("".join(
+            json.dumps({"generation": generation, "index": index, "message": message}) + "\n"
+            for index, message in entries
+        ))
+        self._file.flush()
+
+    def _snapshot(self, generation, messages):
+        # Snapshot first, then truncate: a crash in between leaves stale log
+        # lines that restore() skips by index.
+        write_json_atomic(
+            _snapshot_path(self.directory, self.name),
+            json.dumps({"generation": generation, "messages": messages}),
+        )
+        self._log().truncate(0)
+        logging.debug("Autosave snapshot for %s: %d messages", self.name, len(messages))
+
+
+def restore(name, directory=AUTOSAVE_DIR):
+    """Rebuild the message list saved under ``name`` from its snapshot and log."""
+    flush()
+    snapshot_path = _snapshot_path(directory, name)
+    if not snapshot_path.exists():
+        raise RecordNotFound(f"No autosave named {name!r}")
+    with open(snapshot_path, 'r') as f:
+        snapshot = json.load(f)
+    generation, messages = snapshot["generation"], snapshot["messages"]
+
+    log_path = _log_path(directory, name)
+    if log_path.exists():
+        with open(log_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write.
+                    break
+                if entry["generation"] == generation and entry["index"] == len(messages):
+                    messages.append(entry["message"])
+    return messages
+
+
+def delete(name, directory=AUTOSAVE_DIR):
+    # Queued writes from a detached log would otherwise recreate the files.
+    flush()
+    _snapshot_path(directory, name).unlink(missing_ok=True)
+    _log_path(directory, name).unlink(missing_ok=True)
@@ -1,81 +1,183 @@
+import os
 import json
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Dict, List, Optional
 
+from dotenv import load_dotenv
+
+from bot.models import rules
+
+load_dotenv()
+
+CHARACTERS_DIR = Path(os.getenv('CHARACTERS_DIR', 'data/characters'))
+
+
+def character_path(character_name, directory=None):
+    return Path(directory or CHARACTERS_DIR) / f"{character_name}_character.json"
+
+
+def write_json_atomic(path, data):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@dataclass(slots=True)
 class Character:
-    def __init__(
-        self, 
-        name, 
-        character_class, 
-        race, 
-        level, 
-        background,
-        alignment,
-        experience_points,
-        strength,
-        dexterity,
-        constitution,
-        intelligence,
-        wisdom,
-        charisma, 
-        proficiency_bonus, 
-        skills, 
-        saving_throws, 
-        max_hit_points,
-        hit_dice,
-        death_saves,
-        equipment, 
-        spells,
-        languages,
-        features_and_traits,
-        notes,
-        spell_slots_level_1_max=None,
-        spells_slots_level_1_used=None,
-        current_hit_points=None,
-    ):
-        self.name = name
-        self.character_class = character_class
-        self.race = race
-        self.level = level
-        self.background = background
-        self.alignment = alignment
-        self.experience_points = experience_points
-        self.strength = strength
-        self.dexterity = dexterity
-        self.constitution = constitution
-        self.intelligence = intelligence
-        self.wisdom = wisdom
-        self.charisma = charisma
-        self.proficiency_bonus = proficiency_bonus
-        self.skills = skills
-        self.saving_throws = saving_throws
-        self.max_hit_points = max_hit_points
-        self.current_hit_points = current_hit_points or max_hit_points
-        self.hit_dice = hit_dice
-        self.death_saves = death_saves
-        self.equipment = equipment
-        self.spells = spells
-        self.languages = languages
-        self.features_and_traits = features_and_traits
-        self.notes = notes
-        self.spell_slots_level_1_max = spell_slots_level_1_max or self.lookup_spell_slots(character_class, level)
-        self.spells_slots_level_1_used = spells_slots_level_1_used or 0
-
-    def save(self, filename):
-        with open(filename, 'w') as f:
-            json.dump(self.__dict__, f, indent=4)
+    name: str
+    character_class: str
+    race: str
+    level: int
+    background: str
+    alignment: str
+    experience_points: int
+    strength: int
+    dexterity: int
+    constitution: int
+    intelligence: int
+    wisdom: int
+    charisma: int
+    proficiency_bonus: int
+    skills: List[str]
+    saving_throws: List[str]
+    max_hit_points: int
+    hit_dice: str
+    death_saves: Dict[str, int]
+    equipment: List[str]
+    spells: List[str]
+    languages: List[str]
+    features_and_traits: List[str]
+    notes: str
+    spell_slots_level_1_max: Optional[int] = None
+    spells_slots_level_1_used: Optional[int] = None
+    current_hit_points: Optional[int] = None
+    conditions: Optional[List[str]] = None
+
+    def __post_init__(self):
+        if self.current_hit_points is None:
+            self.current_hit_points = self.max_hit_points
+        if self.spell_slots_level_1_max is None:
+            self.spell_slots_level_1_max = self.lookup_spell_slots(self.character_class, self.level)
+        if self.spells_slots_level_1_used is None:
+            self.spells_slots_level_1_used = 0
+        if self.experience_points is None:
+            self.experience_points = 0
+        if self.spells is None:
+            self.spells = []
+        if self.notes is None:
+            self.notes = ""
+        if self.conditions is None:
+            self.conditions = []
+        self.death_saves = {"successes": 0, "failures": 0, **(self.death_saves or {})}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in FIELD_NAMES}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def apply_delta(self, increments: Dict[str, int]) -> Dict[str, Any]:
+        """Add each increment to its field and return the fields that changed.
+
+        Keys name a top-level field (``"current_hit_points"``) or a counter in
+        a dict field (``"death_saves.successes"``); increments of ``None`` or
+        0 are ignored. The result is nested the same way, holding new values.
+        """
+        changed: Dict[str, Any] = {}
+        for path, amount in increments.items():
+            if not amount:
+                continue
+            field_name, _, key = path.partition(".")
+            if field_name not in FIELD_NAMES:
+                raise KeyError(f"Unknown character field {field_name!r}")
+            if key:
+                counters = getattr(self, field_name)
+                counters[key] = counters.get(key, 0) + amount
+                changed.setdefault(field_name, {})[key] = counters[key]
+            else:
+                value = getattr(self, field_name) + amount
+                setattr(self, field_name, value)
+                changed[field_name] = value
+        return changed
+
+    def diff(self, other: "Character") -> Dict[str, Any]:
+        """Return the fields whose values differ in ``other``, with ``other``'s values."""
+        return {
+            name: getattr(other, name)
+            for name in FIELD_NAMES
+            if getattr(self, name) != getattr(other, name)
+        }
+
+    def copy(self) -> "Character":
+        data = self.to_dict()
+        data["death_saves"] = dict(self.death_saves)
+        data["conditions"] = list(self.conditions)
+        return Character(**data)
+
+    def save(self, filename=None):
+        write_json_atomic(filename or character_path(self.name), self.to_json())
 
     @classmethod
-    def load(cls, character_name):
-        filename=f"data/characters/{character_name}_character.json"
-        with open(filename, 'r') as f:
+    def load(cls, character_name, directory=None):
+        with open(character_path(character_name, directory), 'r') as f:
             data = json.load(f)
         return cls(**data)
     
+    def update_conditions(self, added=None, removed=None) -> Dict[str, Any]:
+        conditions = [condition for condition in self.conditions if condition not in (removed or ())]
+        conditions += [condition for condition in dict.fromkeys(added or ()) if condition not in conditions]
+        if conditions == self.conditions:
+            return {}
+        self.conditions = conditions
+        return {"conditions": conditions}
+
+    def status_line(self) -> str:
+        """One line with what changes during play, for the party-state block sent with each request."""
+        next_level = rules.XP_THRESHOLDS[self.level] if self.level < rules.MAX_LEVEL else None
+        parts = [
+            f"HP {self.current_hit_points}/{self.max_hit_points}",
+            f"XP {self.experience_points}/{next_level or 'max'}",
+        ]
+        if self.spell_slots_level_1_max:
+            remaining = self.spell_slots_level_1_max - self.spells_slots_level_1_used
+            parts.append(f"level 1 slots {remaining}/{self.spell_slots_level_1_max} left")
+        if self.death_saves["successes"] or self.death_saves["failures"]:
+            parts.append(
+                f"death saves {self.death_saves['successes']} successes, {self.death_saves['failures']} failures"
+            )
+        parts.append(f"conditions: {', '.join(self.conditions) or 'none'}")
+        return f"{self.name} ({self.race} {self.character_class} {self.level}): {', '.join(parts)}"
+
+    def apply_level_ups(self) -> Dict[str, Any]:
+        """Raise the level as far as the experience points allow; returns the fields that changed.
+
+        Each level gained adds the fixed hit point increase to both maximum and
+        current hit points, and the proficiency bonus, hit dice and level 1
+        spell slots follow the new level.
+        """
+        target = rules.level_for_experience(self.experience_points)
+        if target <= self.level:
+            return {}
+        before = self.copy()
+        gained = (target - self.level) * rules.hit_points_per_level(self.character_class, self.constitution)
+        self.level = target
+        self.proficiency_bonus = rules.proficiency_bonus(target)
+        self.hit_dice = rules.hit_dice(self.character_class, target)
+        self.spell_slots_level_1_max = self.lookup_spell_slots(self.character_class, target)
+        self.max_hit_points += gained
+        self.current_hit_points += gained
+        return before.diff(self)
+
     def lookup_spell_slots(self, character_class, level):
-        # Lookup table for level 1 spell slots, for example
-        lookup_table = {
-            'Wizard': {1: 2, 2: 3, 3: 4, 4: 4, 5: 4},
-            'Cleric': {1: 2, 2: 3, 3: 4, 4: 4, 5: 4},
-        }
-        
-        # Default to 0 if class or level not found
-        return lookup_table.get(character_class, {}).get(level, 0)
+        # Classes or levels outside the tables have no slots.
+        try:
+            return rules.spell_slots(character_class, level)[0]
+        except (KeyError, ValueError):
+            return 0
+
+
+FIELD_NAMES = tuple(f.name for f in fields(Character))
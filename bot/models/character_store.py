@@ -0,0 +1,116 @@
+import os
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from bot.models.character import Character
+from bot.models.storage import get_storage
+
+load_dotenv()
+
+CHARACTER_FLUSH_SECONDS = float(os.getenv('CHARACTER_FLUSH_SECONDS', '2'))
+
+
+class CharacterRepository:
+    """In-process cache of characters with batched write-behind persistence.
+
+    Reads are served from memory after the first load. Changes mark a
+    character dirty and a background thread writes all dirty characters at
+    most every ``flush_interval`` seconds as one batch to the storage
+    backend. :meth:`close` (registered for interpreter exit) stops the thread
+    and flushes everything still dirty.
+    """
+
+    def __init__(self, storage=None, flush_interval=CHARACTER_FLUSH_SECONDS):
+        self._storage = storage
+        self.flush_interval = flush_interval
+        self._cache = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        # Keeps concurrent flushes from writing an older batch over a newer one.
+        self._flush_lock = threading.Lock()
+        self._pending = threading.Event()
+        self._stop = threading.Event()
+        self._flusher = None
+        atexit.register(self.close)
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = get_storage()
+        return self._storage
+
+    def get(self, name):
+        with self._lock:
+            character = self._cache.get(name)
+        if character is not None:
+            return character
+        # Loaded without the lock so a slow read does not hold up other characters.
+        loaded = Character(**self.storage.load_character(name))
+        with self._lock:
+            return self._cache.setdefault(name, loaded)
+
+    def add(self, character):
+        with self._lock:
+            self._cache[character.name] = character
+            self._dirty.add(character.name)
+        self._schedule_flush()
+
+    @contextmanager
+    def edit(self, name):
+        """Yield a copy to change; it replaces the cached character only if the block does not raise."""
+        self.get(name)
+        with self._lock:
+            character = self._cache[name].copy()
+            yield character
+            self._cache[name] = character
+            self._dirty.add(name)
+        self._schedule_flush()
+
+    def flush(self):
+        # Lock order: _flush_lock, then _lock. Never call this while holding _lock.
+        with self._flush_lock:
+            with self._lock:
+                snapshots = {name: self._cache[name].to_json() for name in self._dirty}
+                self._dirty.clear()
+            if not snapshots:
+                return
+            try:
+                self.storage.save_characters(snapshots)
+            except Exception:
+                logging.exception("Unable to persist characters %s", ", ".join(snapshots))
+                with self._lock:
+                    self._dirty.update(snapshots)
+
+    def close(self):
+        """Stop the background flusher and write whatever is still dirty."""
+        self._stop.set()
+        self._pending.set()
+        with self._lock:
+            flusher = self._flusher
+        if flusher is not None:
+            flusher.join()
+        self.flush()
+
+    def _schedule_flush(self):
+        # Once closed there is no flusher left, so changes are written straight away.
+        if self.flush_interval <= 0 or self._stop.is_set():
+            self.flush()
+            return
+        self._pending.set()
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="character-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._pending.wait()
+            # Let further changes from the same turn land before writing the batch;
+            # close() cuts the wait short.
+            self._stop.wait(self.flush_interval)
+            self._pending.clear()
+            self.flush()
@@ -1,53 +1,71 @@
 import os
 import logging
 import json
+import time
+import threading
+import uuid
 from pathlib import Path
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 import tiktoken
 from dotenv import load_dotenv
 from bot.utils.chat import (
     chat_completion_request,
+    extract_cached_tokens,
+    extract_input_tokens,
     extract_response_text,
     extract_total_tokens,
 )
+from bot.utils.functions import FUNCTIONS
+from bot.utils.logs import Payload, payload_logger
+from bot.utils.metrics import pruned_tokens, summary_seconds
+from bot.utils.routing import CHARACTER, NARRATION, SUMMARY, router
 
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
-LOG_FILE = BASE_DIR / "logs/debug.log"
-SUMMARY_FILE = BASE_DIR / "logs/summaries.log"
-
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.DEBUG,
-    format='%(asctime)s:%(levelname)s:%(message)s',
-    datefmt='%H:%M:%S'
-)
+SUMMARY_FILE = Path(os.getenv('SUMMARY_LOG_FILE') or BASE_DIR / "logs/summaries.log")
 
 GPT_MODEL = os.getenv('GPT_MODEL')
 GPT_ENCODING = os.getenv('GPT_ENCODING')
 
-MODEL_CONTEXT_LIMITS = {
-    "gpt-5-nano": 32000,
-    "gpt-5": 400000,
-    "gpt-4o": 128000,
-    "gpt-5-mini": 400000
-}
-DEFAULT_CONTEXT_LIMIT = 50000
-
-
-def _resolve_context_limit(model_name: str | None) -> int:
-    if not model_name:
-        return DEFAULT_CONTEXT_LIMIT
-    model_key = model_name.lower()
-    for prefix, limit in MODEL_CONTEXT_LIMITS.items():
-        if model_key.startswith(prefix):
-            return limit
-    return DEFAULT_CONTEXT_LIMIT
-
-
-CONTEXT_LIMIT = _resolve_context_limit(GPT_MODEL)
+# Fraction of the context window a request may fill before it is compacted up front.
+PREFLIGHT_TOKEN_RATIO = float(os.getenv('PREFLIGHT_TOKEN_RATIO', '0.9'))
+# Fraction of the context window at which older messages are summarized in the background.
+SUMMARY_TRIGGER_RATIO = float(os.getenv('SUMMARY_TRIGGER_RATIO', '0.7'))
+# Number of same-level summaries that are merged into one higher-level summary.
+SUMMARY_FANOUT = int(os.getenv('SUMMARY_FANOUT', '4'))
+SUMMARY_WORKERS = int(os.getenv('SUMMARY_WORKERS', '2'))
+# Most recent messages that are never folded into a summary.
+SUMMARY_KEEP_RECENT = 4
+
+STORY_SO_FAR = "The story so far:"
+# "stable" sends the fixed system prompt first and the story so far as a separate
+# message after it, so the request prefix stays byte-identical for prompt caching;
+# "inline" folds the story into the system prompt as before.
+PROMPT_LAYOUT = os.getenv('PROMPT_LAYOUT', 'stable').lower()
+# "stateful" chains requests with previous_response_id and only sends what was added since
+# the last response; "resend" sends the whole history every time.
+CONVERSATION_MODE = os.getenv('CONVERSATION_MODE', 'resend').lower()
+PARTY_STATE = "Current party state (kept up to date automatically; it supersedes character sheets returned earlier):"
+# Tools whose ``name`` argument is a party member.
+CHARACTER_TOOLS = frozenset({"create_and_save_character", "update_character", "get_character_state"})
+# Tool outputs are only rewritten once this many tokens can be reclaimed: every rewrite
+# changes the history, so the next request misses the prompt cache from that point on.
+PRUNE_MIN_TOKENS = int(os.getenv('PRUNE_MIN_TOKENS', '2000'))
+# Rulebook answers older than this many player turns are replaced with a stub.
+RULEBOOK_KEEP_TURNS = int(os.getenv('RULEBOOK_KEEP_TURNS', '3'))
+SUMMARIZER_PROMPT = "You are a summarizer. Below you will find a series of interactions between a Dungeon Master and one or more players in a game of D&D. Please summarize the interactions. The summary you generate will be referenced by the Dungeon Master to remember important interactions and events that have occurred."
+MERGE_PROMPT = "You are a summarizer. Below you will find consecutive summaries of a game of D&D, oldest first. Merge them into a single summary that keeps the important interactions and events the Dungeon Master must remember."
+
+_summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
+
+
+# The history is sent on both the narration and the character routes, so it has to fit both.
+CONTEXT_LIMIT = min(router.route(NARRATION).context_limit, router.route(CHARACTER).context_limit)
+# Tokens of history folded into one summary; bounded by the summary model's own window.
+SUMMARY_CHUNK_TOKENS = min(CONTEXT_LIMIT / 12, router.route(SUMMARY).context_limit / 2)
 
 
 @lru_cache(maxsize=1)
@@ -64,37 +82,304 @@ def _get_encoding():
         logging.warning("Unknown encoding '%s'; falling back to cl100k_base", encoding_name)
         return tiktoken.get_encoding("cl100k_base")
 
+
+@lru_cache(maxsize=2048)
+def count_tokens(text: str) -> int:
+    # Memoized on content: repeated payloads such as character JSON are encoded once.
+    return len(_get_encoding().encode(text))
+
+
+@lru_cache(maxsize=1)
+def _tool_definition_tokens() -> int:
+    return count_tokens(json.dumps(FUNCTIONS))
+
+
+def _message_tokens(message) -> int:
+    message_type = message.get("type")
+    if message_type == "function_call":
+        return count_tokens(message.get("name") or "") + count_tokens(message.get("arguments") or "")
+    return count_tokens(message.get("content") or "")
+
+
+def _is_character_sheet(message) -> bool:
+    content = message.get("content") or ""
+    if content.lstrip().startswith('{"error"'):
+        return False
+    # update_character answers with only the changed fields unless CHARACTER_UPDATE_RESPONSE=full.
+    return message.get("name") != "update_character" or '"changed"' not in content
+
+
+def _ledger_role(message) -> str:
+    if message.get("type") == "function_call_output":
+        return "tool"
+    return message.get("role") or "unknown"
+
+def _request_summary(instructions, text):
+    summary_prompt = [
+        {"type": "message", "role": "system", "content": instructions},
+        {"type": "message", "role": "user", "content": text},
+    ]
+    summary_response = chat_completion_request(messages=summary_prompt, functions=[], route=SUMMARY)
+    return extract_response_text(summary_response)
+
+
 class Conversation:
     def __init__(self, system_message="You are a helpful AI Assistant that wants to answer all questions truthfully."):
-        encoding = _get_encoding()
-        system_message_token_count = len(encoding.encode(system_message))
-        self.messages = [
-            {
-                "type": "message",
-                "role": "system",
-                "content": system_message,
-                "token_count": system_message_token_count,
-            }
-        ]
-        logging.debug(self.get_messages())
+        self._lock = threading.RLock()
+        self._summary_future = None
+        self.autosave = None
+        self.cache_key = None
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.generation = 0
+        # Tells this conversation's generations apart from any other's, e.g. before a restart.
+        self.epoch = uuid.uuid4().hex
+        self._init_request_state()
+        self.party = []
+        self.system_prompt = system_message
+        self.summaries = []
+        self.messages = []
+        self.token_total = 0
+        self.tokens_by_role = {}
+        self._append({"type": "message", "role": "system", "content": system_message})
+        payload_logger.debug("Conversation started: %s", Payload(self.get_messages))
+
+    @classmethod
+    def from_messages(cls, messages):
+        conversation = cls.__new__(cls)
+        conversation._lock = threading.RLock()
+        conversation._summary_future = None
+        conversation.autosave = None
+        conversation.cache_key = None
+        conversation.input_tokens = 0
+        conversation.cached_tokens = 0
+        conversation.generation = 0
+        conversation.epoch = uuid.uuid4().hex
+        conversation._init_request_state()
+        conversation.party = []
+        conversation.replace_messages(messages)
+        return conversation
+
+    def _init_request_state(self):
+        self.stateful = CONVERSATION_MODE == "stateful"
+        self.last_response_id = None
+        # Generation the response chain belongs to, and how many wire items the server already holds.
+        self._chain_generation = None
+        self._chained_items = 0
+        self._request_generation = None
+        # Party state the chain already holds, and the one sent with the request in flight.
+        self._chained_party_state = None
+        self._request_party_state = None
+        # Every party-state block sent along a chain stays in it server-side, outside self.messages.
+        self._chain_party_tokens = 0
+        self._request_party_tokens = 0
+        self._request_chained = False
+        # Wire-format copy of self.messages, extended as messages are added and rebuilt per generation.
+        self._wire = []
+        self._wire_count = 0
+        self._wire_generation = None
+
+    def replace_messages(self, messages):
+        with self._lock:
+            autosave, self.autosave = self.autosave, None
+            self.generation += 1
+            self.messages = []
+            self.token_total = 0
+            self.tokens_by_role = {}
+            # Members named by calls that have since been summarized away are kept on the system message.
+            self.party = list(messages[0].get("party", ())) if messages else []
+            for message in messages:
+                self._append(message)
+            self.system_prompt, self.summaries = self._parse_system_message()
+            self.autosave = autosave
+            self._sync_autosave()
+
+    def attach_autosave(self, autosave):
+        with self._lock:
+            self.autosave = autosave
+            self._sync_autosave()
+
+    def _sync_autosave(self):
+        # Caller holds self._lock. Only queues the writes; the autosave writer thread does the I/O.
+        if self.autosave is not None:
+            self.autosave.sync(self.generation, self.messages)
+
+    def snapshot(self):
+        """Return ``(epoch, generation, messages)`` captured together, for persistence."""
+        with self._lock:
+            return self.epoch, self.generation, list(self.messages)
+
+    def _parse_system_message(self):
+        system_message = self.messages[0] if self.messages else {}
+        content = system_message.get("content", "")
+        if "summaries" in system_message:
+            return content.split(f"\n{STORY_SO_FAR}", 1)[0], system_message["summaries"]
+        if STORY_SO_FAR not in content:
+            return content, []
+        prompt, story = content.split(STORY_SO_FAR, 1)
+        # Summaries written before the hierarchy existed come back as one top-level entry.
+        return prompt.rstrip("\n"), [{"level": SUMMARY_FANOUT, "text": story.strip()}]
+
+    def _append(self, message):
+        token_count = message.get("token_count")
+        if not token_count:
+            token_count = _message_tokens(message)
+            message["token_count"] = token_count
+        with self._lock:
+            self.messages.append(message)
+            self._count(message, token_count)
+            if message.get("type") == "function_call" and message.get("name") in CHARACTER_TOOLS:
+                self._note_party_member(message.get("arguments"))
+            self._sync_autosave()
+
+    def _note_party_member(self, arguments):
+        try:
+            name = json.loads(arguments or "{}").get("name")
+        except (ValueError, AttributeError):
+            return
+        if isinstance(name, str) and name and name not in self.party:
+            self.party.append(name)
+
+    def forget_party_member(self, name):
+        with self._lock:
+            if name in self.party:
+                self.party.remove(name)
+
+    def _count(self, message, token_count):
+        role = _ledger_role(message)
+        self.token_total += token_count
+        self.tokens_by_role[role] = self.tokens_by_role.get(role, 0) + token_count
+
+    def _rebuild_ledger(self):
+        self.token_total = 0
+        self.tokens_by_role = {}
+        for message in self.messages:
+            self._count(message, message["token_count"])
+
+    def estimated_request_tokens(self):
+        chained = self._chain_party_tokens if self._chain_generation == self.generation else 0
+        return self.token_total + _tool_definition_tokens() + chained
+
+    def over_budget(self, limit=None):
+        return self.estimated_request_tokens() > (limit or CONTEXT_LIMIT) * PREFLIGHT_TOKEN_RATIO
+
+    def ensure_within_budget(self, limit=None):
+        """Compact history before a request that would not fit in the context window."""
+        if not self.over_budget(limit):
+            return False
+        budget = (limit or CONTEXT_LIMIT) * PREFLIGHT_TOKEN_RATIO
+        self._summarize()
+        if self.estimated_request_tokens() > budget:
+            self._trim_to(budget)
+        return True
+
+    def _trim_to(self, budget):
+        # Last resort: drop the oldest turns, keeping function calls paired with their outputs.
+        with self._lock:
+            dropped_calls = set()
+            kept = [self.messages[0]]
+            removable = self.messages[1:-1]
+            # The newest message is always kept, so if it is a tool output its call must stay too.
+            last = self.messages[-1] if len(self.messages) > 1 else {}
+            protected_call = last.get("call_id") if last.get("type") == "function_call_output" else None
+            remaining = self.estimated_request_tokens()
+            for message in removable:
+                is_system = message["type"] == "message" and message["role"] == "system"
+                droppable = message["type"] != "function_call_output" and not is_system
+                if protected_call is not None and message.get("call_id") == protected_call:
+                    droppable = False
+                if remaining > budget and droppable:
+                    if message["type"] == "function_call":
+                        dropped_calls.add(message["call_id"])
+                    remaining -= message["token_count"]
+                    continue
+                if message["type"] == "function_call_output" and message["call_id"] in dropped_calls:
+                    remaining -= message["token_count"]
+                    continue
+                kept.append(message)
+            kept.extend(self.messages[-1:] if len(self.messages) > 1 else [])
+            self.messages = kept
+            self.generation += 1
+            self._rebuild_ledger()
+            self._sync_autosave()
+        logging.warning("Trimmed conversation to %d estimated tokens", self.estimated_request_tokens())
 
     def add_system_message(self, content):
-        encoding = _get_encoding()
-        token_count = len(encoding.encode(content))
-        self.messages.append(
-            {"type": "message", "role": "system", "content": content, "token_count": token_count}
-        )
+        self._append({"type": "message", "role": "system", "content": content})
 
     def add_user_message(self, content):
-        encoding = _get_encoding()
-        token_count = len(encoding.encode(content))
-        self.messages.append(
-            {"type": "message", "role": "user", "content": content, "token_count": token_count}
-        )
+        # Between turns, so a rewrite never lands in the middle of a tool loop.
+        self.prune_tool_outputs()
+        self._append({"type": "message", "role": "user", "content": content})
+
+    def prune_tool_outputs(self, min_tokens=None):
+        """Replace superseded tool outputs with short stubs; returns the tokens reclaimed.
+
+        A character sheet is superseded by a later sheet for the same
+        character, which also covers the ``update_character`` results before
+        it; rulebook answers go stale after ``RULEBOOK_KEEP_TURNS`` turns. The
+        outputs stay in place, so every call keeps its matching output.
+        """
+        with self._lock:
+            if self._summary_future is not None and not self._summary_future.done():
+                # The summary would be discarded once the history changes underneath it.
+                return 0
+            reclaimed = {}
+            stale = {}
+            for index, stub in self._stale_outputs().items():
+                saving = self.messages[index]["token_count"] - count_tokens(stub)
+                if saving > 0:
+                    reclaimed[index] = saving
+                    stale[index] = stub
+            if not stale or sum(reclaimed.values()) < (PRUNE_MIN_TOKENS if min_tokens is None else min_tokens):
+                return 0
+            for index, stub in stale.items():
+                message = dict(self.messages[index], content=stub, pruned=True)
+                message["token_count"] = _message_tokens(message)
+                self.messages[index] = message
+                pruned_tokens.inc(reclaimed[index], tool=message.get("name") or "")
+            self.generation += 1
+            self._rebuild_ledger()
+            self._sync_autosave()
+        logging.info("Pruned %d stale tool outputs (%d tokens)", len(stale), sum(reclaimed.values()))
+        return sum(reclaimed.values())
+
+    def _stale_outputs(self):
+        # Caller holds self._lock. Walks newest to oldest, so the first sheet seen per character is the one kept.
+        characters = {}
+        for message in self.messages:
+            if message.get("type") == "function_call" and message.get("name") in CHARACTER_TOOLS:
+                try:
+                    characters[message["call_id"]] = json.loads(message.get("arguments") or "{}").get("name")
+                except (ValueError, AttributeError):
+                    continue
+        stale = {}
+        sheets = set()
+        turns = 0
+        for index in range(len(self.messages) - 1, 0, -1):
+            message = self.messages[index]
+            if message.get("type") == "message" and message.get("role") == "user":
+                turns += 1
+                continue
+            if message.get("type") != "function_call_output" or message.get("pruned"):
+                continue
+            tool = message.get("name")
+            if tool == "consult_rulebook":
+                if turns > RULEBOOK_KEEP_TURNS:
+                    stale[index] = "Pruned: an old rulebook answer. Call consult_rulebook again if it is needed."
+            elif tool in CHARACTER_TOOLS:
+                name = characters.get(message["call_id"])
+                if name is None:
+                    continue
+                if name in sheets:
+                    stale[index] = f"Pruned: superseded by a later character sheet for {name}."
+                elif _is_character_sheet(message):
+                    sheets.add(name)
+        return stale
 
     def add_assistant_response(self, response):
-        encoding = _get_encoding()
         total_tokens = extract_total_tokens(response)
+        self._record_prompt_cache(response)
 
         for item in getattr(response, "output", []):
             item_type = getattr(item, "type", None)
@@ -105,17 +390,15 @@ class Conversation:
                         text_segments.append(content.text)
                 assistant_text = "".join(text_segments).strip()
                 if assistant_text:
-                    token_count = len(encoding.encode(assistant_text))
-                    self.messages.append(
+                    self._append(
                         {
                             "type": "message",
                             "role": "assistant",
                             "content": assistant_text,
-                            "token_count": token_count,
                         }
                     )
             elif item_type == "function_call":
-                self.messages.append(
+                self._append(
                     {
                         "type": "function_call",
                         "role": "assistant",
@@ -123,127 +406,251 @@ class Conversation:
                         "arguments": item.arguments,
                         "call_id": item.call_id,
                         "status": getattr(item, "status", None),
-                        "token_count": 0,
                     }
                 )
 
-        if total_tokens and total_tokens > CONTEXT_LIMIT:
-            self._summarize()
+        self._record_chain(response)
+
+        trigger = CONTEXT_LIMIT * SUMMARY_TRIGGER_RATIO
+        if (total_tokens and total_tokens > trigger) or self.token_total > trigger:
+            self.request_summary()
+
+    def _record_chain(self, response):
+        if not self.stateful:
+            return
+        response_id = getattr(response, "id", None)
+        with self._lock:
+            # A summary that landed while the request was in flight means the server holds
+            # the old, longer history; start over from the compacted one instead.
+            if response_id and self._request_generation == self.generation:
+                self.last_response_id = response_id
+                self._chain_generation = self.generation
+                self._chained_items = len(self._sync_wire())
+                self._chained_party_state = self._request_party_state
+                previous = self._chain_party_tokens if self._request_chained else 0
+                self._chain_party_tokens = previous + self._request_party_tokens
+            else:
+                self.reset_chain()
+
+    def reset_chain(self):
+        """Send the full history with the next request, e.g. after the stored response expired."""
+        with self._lock:
+            self.last_response_id = None
+            self._chain_generation = None
+            self._chained_items = 0
+            self._chained_party_state = None
+            self._chain_party_tokens = 0
+
+    def request_input(self, party_state=None):
+        """Return ``(input_items, previous_response_id)`` for the next model call.
+
+        In stateful mode only the items added since the last response are sent,
+        chained to it; after a summary, trim or reload (a new generation) the
+        full history goes out again and a new chain starts.
+
+        ``party_state`` is appended as a system message after the history, so
+        it never invalidates the cached prefix and is not stored in
+        ``self.messages``. A chain already holds the last one it was sent, so
+        there it only goes out again when it has changed.
+        """
+        with self._lock:
+            wire = self._sync_wire()
+            self._request_generation = self.generation
+            self._request_party_state = party_state
+            block = [self._party_state_item(party_state)] if party_state else []
+            self._request_chained = bool(
+                self.stateful and self.last_response_id and self._chain_generation == self.generation
+            )
+            if self._request_chained and party_state == self._chained_party_state:
+                block = []
+            self._request_party_tokens = count_tokens(block[0]["content"]) if block else 0
+            if self._request_chained:
+                return wire[self._chained_items:] + block, self.last_response_id
+            return list(wire) + block, None
+
+    def _party_state_item(self, party_state):
+        return {"type": "message", "role": "system", "content": f"{PARTY_STATE}\n{party_state}"}
+
+    def _record_prompt_cache(self, response):
+        input_tokens = extract_input_tokens(response)
+        if not input_tokens:
+            return
+        cached_tokens = extract_cached_tokens(response) or 0
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+        logging.debug("Prompt cache: %d of %d input tokens cached", cached_tokens, input_tokens)
+
+    def prompt_cache_hit_rate(self):
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
 
     def add_function_message(self, function_name, call_id, function_response):
-        encoding = _get_encoding()
         if isinstance(function_response, str):
             payload = function_response
         else:
             payload = json.dumps(function_response)
-        token_count = len(encoding.encode(payload))
-        self.messages.append(
+        self._append(
             {
                 "type": "function_call_output",
                 "name": function_name,
                 "call_id": call_id,
                 "content": payload,
-                "token_count": token_count,
             }
         )
 
     def get_messages(self):
-        serialized_messages = []
-        for message in self.messages:
-            message_type = message.get("type")
-            if not message_type:
-                logging.warning("Skipping message without type: %s", message)
-                continue
-            if message_type == "message":
-                serialized_messages.append(
-                    {
-                        "type": "message",
-                        "role": message["role"],
-                        "content": message["content"],
-                    }
-                )
-            elif message_type == "function_call":
-                serialized_messages.append(
-                    {
-                        "type": "function_call",
-                        "name": message["name"],
-                        "arguments": message["arguments"],
-                        "call_id": message["call_id"],
-                    }
-                )
-            elif message_type == "function_call_output":
-                serialized_messages.append(
-                    {
-                        "type": "function_call_output",
-                        "call_id": message["call_id"],
-                        "output": message["content"],
-                    }
-                )
-        return serialized_messages
+        with self._lock:
+            return list(self._sync_wire())
+
+    def _sync_wire(self):
+        # Caller holds self._lock. Only messages added since the last call are serialized;
+        # anything that rewrites history bumps the generation and triggers a rebuild.
+        if self._wire_generation != self.generation:
+            self._wire = []
+            self._wire_count = 0
+            self._wire_generation = self.generation
+        for index in range(self._wire_count, len(self.messages)):
+            self._wire.extend(self._serialize(index, self.messages[index]))
+        self._wire_count = len(self.messages)
+        return self._wire
+
+    def _serialize(self, index, message):
+        message_type = message.get("type")
+        if not message_type:
+            logging.warning("Skipping message without type: %s", message)
+            return []
+        if index == 0 and PROMPT_LAYOUT == "stable" and message.get("summaries"):
+            return self._stable_prefix(message["summaries"])
+        if message_type == "message":
+            return [{"type": "message", "role": message["role"], "content": message["content"]}]
+        if message_type == "function_call":
+            return [
+                {
+                    "type": "function_call",
+                    "name": message["name"],
+                    "arguments": message["arguments"],
+                    "call_id": message["call_id"],
+                }
+            ]
+        if message_type == "function_call_output":
+            return [{"type": "function_call_output", "call_id": message["call_id"], "output": message["content"]}]
+        return []
+
+    def request_summary(self):
+        """Compact older messages on a background worker; the current turn does not wait."""
+        with self._lock:
+            if self._summary_future is not None and not self._summary_future.done():
+                return self._summary_future
+            self._summary_future = _summary_executor.submit(self._compact)
+            return self._summary_future
 
     def _summarize(self):
-        messages_to_be_summarized = []
-        token_count_to_be_summarized = 0
-        encoding = _get_encoding()
+        """Compact older messages now, waiting for any background compaction first."""
+        future = self._summary_future
+        if future is not None:
+            future.result()
+        self._compact()
+
+    def _select_prefix(self):
+        # Caller holds self._lock. Returns the end index of the oldest chunk worth summarizing,
+        # never splitting a function call from its output and never touching the recent tail.
+        limit = len(self.messages) - SUMMARY_KEEP_RECENT
+        open_calls = set()
+        tokens = 0
+        for index in range(1, max(limit, 1)):
+            message = self.messages[index]
+            if message["type"] == "function_call":
+                open_calls.add(message["call_id"])
+            elif message["type"] == "function_call_output":
+                open_calls.discard(message["call_id"])
+            tokens += message["token_count"]
+            if tokens > SUMMARY_CHUNK_TOKENS and not open_calls:
+                return index + 1
+        return None
+
+    def _compact(self):
+        started = time.perf_counter()
+        outcome = self._compact_history()
+        if outcome != "skipped":
+            summary_seconds.observe(time.perf_counter() - started, outcome=outcome)
+        return outcome == "summarized"
+
+    def _compact_history(self):
+        try:
+            with self._lock:
+                cut = self._select_prefix()
+                if cut is None:
+                    return "skipped"
+                generation = self.generation
+                prefix = self.messages[1:cut]
+                summaries = list(self.summaries)
+
+            transcript = ""
+            for message in prefix:
+                if message["type"] != "message":
+                    continue
+                if message["role"] == "assistant":
+                    transcript += f"DungeonMaster: {message['content']}\n"
+                elif message["role"] == "user":
+                    transcript += f"Player: {message['content']}\n"
+            summary_text = _request_summary(
+                SUMMARIZER_PROMPT, f"Please summarize the following D&D session: {transcript}"
+            )
+            summaries = self._roll_up(summaries + [{"level": 0, "text": summary_text}])
+
+            with self._lock:
+                if self.generation != generation:
+                    logging.info("History changed while summarizing; discarding the summary")
+                    return "discarded"
+                system_message = dict(self.messages[0])
+                system_message["content"] = self._system_content(summaries)
+                system_message["summaries"] = summaries
+                system_message["party"] = list(self.party)
+                system_message["token_count"] = count_tokens(system_message["content"])
+                # Only appends can happen while we summarize, so messages[cut:] is everything newer.
+                self.messages = [system_message] + self.messages[cut:]
+                self.summaries = summaries
+                self.generation += 1
+                self._rebuild_ledger()
+                self._sync_autosave()
+
+            SUMMARY_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with open(SUMMARY_FILE, "a") as file:
+                file.write(f"Messages summarized:\n{prefix}\n")
+                file.write(f"Summary generated:\n{summary_text}\n")
+            return "summarized"
+        except Exception:  # noqa: BLE001 - history is left as-is and compaction is retried later
+            logging.exception("Summarization failed")
+            return "failed"
+
+    def _roll_up(self, summaries):
+        # Merge runs of SUMMARY_FANOUT same-level summaries into one summary a level higher,
+        # so each request only ever re-reads a bounded number of summaries.
+        while True:
+            level = summaries[-1]["level"]
+            run = [summary for summary in summaries if summary["level"] == level]
+            if len(run) < SUMMARY_FANOUT:
+                return summaries
+            merged_text = _request_summary(
+                MERGE_PROMPT, "\n\n".join(summary["text"] for summary in run)
+            )
+            summaries = [summary for summary in summaries if summary["level"] != level]
+            summaries.append({"level": level + 1, "text": merged_text})
+            summaries.sort(key=lambda summary: -summary["level"])
+
+    def _stable_prefix(self, summaries):
+        # The system prompt never changes, so everything up to the story so far
+        # (tool definitions included) is served from the provider's prompt cache.
+        return [
+            {"type": "message", "role": "system", "content": self.system_prompt},
+            {"type": "message", "role": "system", "content": self._story(summaries)},
+        ]
 
-        for message in self.messages:
-            if message["type"] != "message" or message["role"] == "system":
-                continue
+    def _story(self, summaries):
+        story = "\n".join(summary["text"] for summary in summaries)
+        return f"{STORY_SO_FAR} {story}"
 
-            token_count_to_be_summarized += message["token_count"]
-            messages_to_be_summarized.append(message)
-
-            if token_count_to_be_summarized > CONTEXT_LIMIT / 12:
-                existing_summaries = ""
-                for msg in self.messages:
-                    if msg["type"] == "message" and msg["role"] == "system" and 'The story so far:' in msg['content']:
-                        existing_summaries += msg['content'].split('The story so far:')[1] + "\n"
-
-                text_to_summarize = existing_summaries
-                for message in messages_to_be_summarized:
-                    role = message["role"]
-                    content = message["content"]
-                    if role == 'assistant':
-                        text_to_summarize += f"DungeonMaster: {content}\n"
-                    elif role == 'user':
-                        text_to_summarize += f"Player: {content}\n"
-
-                summary_prompt = [
-                    {
-                        "type": "message",
-                        "role": 'system',
-                        "content": "You are a summarizer. Below you will find a series of interactions between a Dungeon Master and one or more players in a game of D&D. Please summarize the interactions. The summary you generate will be referenced by the Dungeon Master to remember important interactions and events that have occurred.",
-                    },
-                    {
-                        "type": "message",
-                        "role": 'user',
-                        "content": f"Please summarize the following D&D session: {text_to_summarize}",
-                    },
-                ]
-
-                summary_response = chat_completion_request(messages=summary_prompt, functions=[])
-                print("summarizing")
-                summary_text = extract_response_text(summary_response)
-
-                for msg in self.messages:
-                    if msg["type"] == "message" and msg["role"] == "system":
-                        if 'The story so far:' in msg['content']:
-                            msg['content'] = msg['content'].split('The story so far:')[0] + "\nThe story so far: " + summary_text
-                        else:
-                            msg['content'] += "\nThe story so far: " + summary_text
-                        msg['token_count'] = len(encoding.encode(msg["content"]))
-                        break
-
-                self.messages = [msg for msg in self.messages if msg not in messages_to_be_summarized]
-
-                with open(SUMMARY_FILE, "a") as file:
-                    file.write(f"Messages summarized:\n{messages_to_be_summarized}\n")
-                    file.write(f"Summary generated:\n{summary_text}\n")
-
-                messages_to_be_summarized = []
-                token_count_to_be_summarized = 0
-
-                return
-                
-
-        
+    def _system_content(self, summaries):
+        if not summaries:
+            return self.system_prompt
+        return f"{self.system_prompt}\n{self._story(summaries)}"
@@ -0,0 +1,157 @@
+"""D&D 5e class progression tables from the SRD, precomputed per class and level.
+
+Answering these locally is instant and exact, where asking the model (or
+``consult_rulebook``) costs a full round-trip and sometimes a wrong sum.
+"""
+from bisect import bisect_right
+from typing import Any, Dict, Tuple
+
+MAX_LEVEL = 20
+SPELL_LEVELS = 9
+
+# Minimum experience points for levels 1-20.
+XP_THRESHOLDS = (
+    0, 300, 900, 2700, 6500, 14000, 23000, 34000, 48000, 64000,
+    85000, 100000, 120000, 140000, 165000, 195000, 225000, 265000, 305000, 355000,
+)
+
+HIT_DIE = {
+    "Barbarian": 12,
+    "Bard": 8,
+    "Cleric": 8,
+    "Druid": 8,
+    "Fighter": 10,
+    "Monk": 8,
+    "Paladin": 10,
+    "Ranger": 10,
+    "Rogue": 8,
+    "Sorcerer": 6,
+    "Warlock": 8,
+    "Wizard": 6,
+}
+
+# Slots per spell level (1st upwards) for levels 1-20.
+_FULL_CASTER = (
+    (2,), (3,), (4, 2), (4, 3), (4, 3, 2), (4, 3, 3), (4, 3, 3, 1), (4, 3, 3, 2), (4, 3, 3, 3, 1), (4, 3, 3, 3, 2),
+    (4, 3, 3, 3, 2, 1), (4, 3, 3, 3, 2, 1), (4, 3, 3, 3, 2, 1, 1), (4, 3, 3, 3, 2, 1, 1),
+    (4, 3, 3, 3, 2, 1, 1, 1), (4, 3, 3, 3, 2, 1, 1, 1), (4, 3, 3, 3, 2, 1, 1, 1, 1),
+    (4, 3, 3, 3, 3, 1, 1, 1, 1), (4, 3, 3, 3, 3, 2, 1, 1, 1), (4, 3, 3, 3, 3, 2, 2, 1, 1),
+)
+_HALF_CASTER = (
+    (), (2,), (3,), (3,), (4, 2), (4, 2), (4, 3), (4, 3), (4, 3, 2), (4, 3, 2),
+    (4, 3, 3), (4, 3, 3), (4, 3, 3, 1), (4, 3, 3, 1), (4, 3, 3, 2), (4, 3, 3, 2),
+    (4, 3, 3, 3, 1), (4, 3, 3, 3, 1), (4, 3, 3, 3, 2), (4, 3, 3, 3, 2),
+)
+# Warlock pact magic: (number of slots, slot level) for levels 1-20.
+_PACT_MAGIC = (
+    (1, 1), (2, 1), (2, 2), (2, 2), (2, 3), (2, 3), (2, 4), (2, 4), (2, 5), (2, 5),
+    (3, 5), (3, 5), (3, 5), (3, 5), (3, 5), (3, 5), (4, 5), (4, 5), (4, 5), (4, 5),
+)
+_CASTER_PROGRESSION = {
+    "Bard": _FULL_CASTER,
+    "Cleric": _FULL_CASTER,
+    "Druid": _FULL_CASTER,
+    "Sorcerer": _FULL_CASTER,
+    "Wizard": _FULL_CASTER,
+    "Paladin": _HALF_CASTER,
+    "Ranger": _HALF_CASTER,
+}
+
+
+def _pad(slots):
+    return tuple(slots) + (0,) * (SPELL_LEVELS - len(slots))
+
+
+def _pact_slots(count, slot_level):
+    return tuple(count if spell_level == slot_level else 0 for spell_level in range(1, SPELL_LEVELS + 1))
+
+
+# SPELL_SLOTS[class][level] -> slots for spell levels 1-9; index 0 is unused so levels index directly.
+SPELL_SLOTS: Dict[str, Tuple[Tuple[int, ...], ...]] = {
+    character_class: ((),) + tuple(
+        _pact_slots(*_PACT_MAGIC[level - 1]) if character_class == "Warlock"
+        else _pad(_CASTER_PROGRESSION[character_class][level - 1]) if character_class in _CASTER_PROGRESSION
+        else _pad(())
+        for level in range(1, MAX_LEVEL + 1)
+    )
+    for character_class in HIT_DIE
+}
+PROFICIENCY_BONUS = (0,) + tuple(2 + (level - 1) // 4 for level in range(1, MAX_LEVEL + 1))
+
+
+def _check_level(level):
+    if not 1 <= level <= MAX_LEVEL:
+        raise ValueError(f"Level must be between 1 and {MAX_LEVEL}, not {level}")
+
+
+def _check_class(character_class):
+    if character_class not in HIT_DIE:
+        raise KeyError(f"Unknown class {character_class!r}")
+
+
+def ability_modifier(score: int) -> int:
+    return (score - 10) // 2
+
+
+def proficiency_bonus(level: int) -> int:
+    _check_level(level)
+    return PROFICIENCY_BONUS[level]
+
+
+def level_for_experience(experience_points: int) -> int:
+    return max(1, bisect_right(XP_THRESHOLDS, experience_points or 0))
+
+
+def experience_for_level(level: int) -> int:
+    _check_level(level)
+    return XP_THRESHOLDS[level - 1]
+
+
+def hit_dice(character_class: str, level: int) -> str:
+    _check_class(character_class)
+    _check_level(level)
+    return f"{level}d{HIT_DIE[character_class]}"
+
+
+def hit_points_per_level(character_class: str, constitution: int) -> int:
+    """Fixed hit point increase per level after the first (the die average, rounded up)."""
+    _check_class(character_class)
+    return max(1, HIT_DIE[character_class] // 2 + 1 + ability_modifier(constitution))
+
+
+def max_hit_points(character_class: str, level: int, constitution: int) -> int:
+    """Hit points with the maximum die at level 1 and the fixed increase afterwards."""
+    _check_class(character_class)
+    _check_level(level)
+    first_level = max(1, HIT_DIE[character_class] + ability_modifier(constitution))
+    return first_level + (level - 1) * hit_points_per_level(character_class, constitution)
+
+
+def spell_slots(character_class: str, level: int) -> Tuple[int, ...]:
+    """Slots for spell levels 1-9; all zero for classes without spellcasting."""
+    _check_class(character_class)
+    _check_level(level)
+    return SPELL_SLOTS[character_class][level]
+
+
+def class_rules(character_class: str, level: int | None = None, experience_points: int | None = None) -> Dict[str, Any]:
+    """Everything the tables say about ``character_class`` at ``level``.
+
+    Without a level, the level is the one ``experience_points`` has reached.
+    """
+    if level is None:
+        level = level_for_experience(experience_points or 0)
+    slots = spell_slots(character_class, level)
+    rules = {
+        "character_class": character_class,
+        "level": level,
+        "proficiency_bonus": proficiency_bonus(level),
+        "hit_die": f"d{HIT_DIE[character_class]}",
+        "hit_dice": hit_dice(character_class, level),
+        "experience_points_for_level": experience_for_level(level),
+        "experience_points_for_next_level": XP_THRESHOLDS[level] if level < MAX_LEVEL else None,
+        "spell_slots": {str(spell_level): count for spell_level, count in enumerate(slots, start=1) if count},
+    }
+    if character_class == "Warlock":
+        rules["pact_magic"] = True
+    return rules
@@ -0,0 +1,267 @@
+import os
+import re
+import asyncio
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from dotenv import load_dotenv
+
+from bot.models import autosave
+from bot.models.conversation import Conversation
+from bot.models.storage import SESSION, RecordNotFound, get_storage
+
+DEFAULT_SESSION_ID = "default"
+load_dotenv()
+
+SESSION_MAX_ACTIVE = int(os.getenv('SESSION_MAX_ACTIVE', '256'))
+SESSION_IDLE_SECONDS = float(os.getenv('SESSION_IDLE_SECONDS', '1800'))
+SESSION_SWEEP_SECONDS = float(os.getenv('SESSION_SWEEP_SECONDS', '60'))
+
+_SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class InvalidSessionId(ValueError):
+    pass
+
+
+def validate_session_id(session_id):
+    if not session_id:
+        return DEFAULT_SESSION_ID
+    if not isinstance(session_id, str) or not _SESSION_ID_PATTERN.match(session_id):
+        raise InvalidSessionId("session_id must be 1-64 characters of letters, digits, '-' or '_'.")
+    return session_id
+
+
+class _Session:
+    __slots__ = ("conversation", "lock", "async_waiters", "last_used", "pins", "loaded")
+
+    def __init__(self):
+        # A placeholder until ``loaded`` is set; the load itself runs outside the manager lock.
+        self.conversation = None
+        self.loaded = threading.Event()
+        self.lock = threading.Lock()
+        # Async turns queue here, so at most one of them per session waits on ``lock`` in a thread.
+        self.async_waiters = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.pins = 0
+
+
+class SessionManager:
+    """In-memory registry of conversations keyed by session ID.
+
+    Turns within a session are serialized by a per-session lock while different
+    sessions proceed in parallel. The least recently used sessions are evicted
+    once ``max_active`` is exceeded or after ``idle_seconds`` without use, and
+    their messages are spilled to the storage backend so they can be restored
+    later. With autosave enabled every message is also appended to a
+    per-session log as it is added, so sessions survive a crash too.
+    """
+
+    def __init__(
+        self,
+        conversation_factory,
+        max_active=SESSION_MAX_ACTIVE,
+        idle_seconds=SESSION_IDLE_SECONDS,
+        storage=None,
+        autosave_enabled=autosave.AUTOSAVE_ENABLED,
+    ):
+        self.conversation_factory = conversation_factory
+        self.autosave_enabled = autosave_enabled
+        self.max_active = max_active
+        self.idle_seconds = idle_seconds
+        self._storage = storage
+        self._sessions = OrderedDict()
+        self._spilling = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = get_storage()
+        return self._storage
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    @contextmanager
+    def session(self, session_id=DEFAULT_SESSION_ID):
+        """Yield the conversation for ``session_id`` while holding its turn lock."""
+        entry = self._checkout(session_id)
+        try:
+            with entry.lock:
+                yield entry.conversation
+        finally:
+            self._checkin(entry)
+
+    @asynccontextmanager
+    async def session_async(self, session_id=DEFAULT_SESSION_ID):
+        """Async variant of :meth:`session` that never blocks the event loop on a busy session."""
+        session_id = validate_session_id(session_id)
+        # Restoring and spilling sessions touch storage, so checkout runs off the event loop.
+        checkout = asyncio.ensure_future(asyncio.to_thread(self._checkout, session_id))
+        try:
+            entry = await asyncio.shield(checkout)
+        except asyncio.CancelledError:
+            checkout.add_done_callback(lambda future: future.exception() or self._checkin(future.result()))
+            raise
+        try:
+            async with entry.async_waiters:
+                await self._acquire_async(entry)
+                try:
+                    yield entry.conversation
+                finally:
+                    entry.lock.release()
+        finally:
+            self._checkin(entry)
+
+    async def _acquire_async(self, entry):
+        if entry.lock.acquire(blocking=False):
+            return
+        # Only a sync turn or a reset can hold the lock here; wait for it in a thread.
+        acquire = asyncio.ensure_future(asyncio.to_thread(entry.lock.acquire))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # The waiting thread still takes the lock; hand it straight back.
+            acquire.add_done_callback(lambda _: entry.lock.release())
+            raise
+
+    def reset(self, session_id=DEFAULT_SESSION_ID):
+        session_id = validate_session_id(session_id)
+        # The stored history is about to be deleted, so it is not loaded first.
+        entry = self._checkout(session_id, restore=False)
+        try:
+            with entry.lock:
+                self._detach_autosave(entry.conversation)
+                if self.autosave_enabled:
+                    autosave.delete(session_id)
+                entry.conversation = self._bind(session_id, self.conversation_factory())
+        finally:
+            self._checkin(entry)
+        self.storage.delete_messages(SESSION, session_id)
+
+    def _checkout(self, session_id, restore=True):
+        session_id = validate_session_id(session_id)
+        while True:
+            with self._lock:
+                entry = self._sessions.get(session_id)
+                loader = entry is None
+                if loader:
+                    spilling = self._spilling.pop(session_id, None)
+                    entry = _Session()
+                    self._sessions[session_id] = entry
+                self._sessions.move_to_end(session_id)
+                now = time.monotonic()
+                entry.pins += 1
+                entry.last_used = now
+                evicted = self._pop_over_capacity()
+                if now - self._last_sweep >= SESSION_SWEEP_SECONDS:
+                    evicted.extend(self._pop_idle(now))
+            for evicted_id, evicted_entry in evicted:
+                self._spill(evicted_id, evicted_entry.conversation)
+            if loader:
+                self._load(session_id, entry, spilling, restore)
+            # Storage I/O happens outside self._lock; other checkouts of this session wait here.
+            entry.loaded.wait()
+            if entry.conversation is not None:
+                return entry
+            # The load failed and the placeholder was dropped; start over.
+            self._checkin(entry)
+
+    def _load(self, session_id, entry, conversation, restore):
+        try:
+            if conversation is None:
+                conversation = self._restore(session_id) if restore else self.conversation_factory()
+            entry.conversation = self._bind(session_id, conversation)
+        except BaseException:
+            with self._lock:
+                if self._sessions.get(session_id) is entry:
+                    del self._sessions[session_id]
+            raise
+        finally:
+            entry.loaded.set()
+
+    def _checkin(self, entry):
+        with self._lock:
+            entry.pins -= 1
+            entry.last_used = time.monotonic()
+
+    def _pop_idle(self, now):
+        # Caller holds self._lock.
+        self._last_sweep = now
+        cutoff = now - self.idle_seconds
+        idle = [
+            session_id
+            for session_id, entry in self._sessions.items()
+            if entry.last_used < cutoff and not entry.pins and entry.loaded.is_set()
+        ]
+        return [self._pop(session_id) for session_id in idle]
+
+    def _pop_over_capacity(self):
+        # Caller holds self._lock. Pinned sessions have a turn in flight and are skipped.
+        evicted = []
+        overflow = len(self._sessions) - self.max_active
+        if overflow <= 0:
+            return evicted
+        for session_id, entry in list(self._sessions.items()):
+            if overflow <= 0:
+                break
+            if entry.pins or not entry.loaded.is_set():
+                continue
+            evicted.append(self._pop(session_id))
+            overflow -= 1
+        return evicted
+
+    def _pop(self, session_id):
+        # Caller holds self._lock. The conversation stays reachable through
+        # _spilling until it is on disk so a concurrent checkout cannot miss it.
+        entry = self._sessions.pop(session_id)
+        self._detach_autosave(entry.conversation)
+        self._spilling[session_id] = entry.conversation
+        return session_id, entry
+
+    def _bind(self, session_id, conversation):
+        # One prompt cache key per session keeps its requests on the same cache shard.
+        conversation.cache_key = f"session-{session_id}"
+        if self.autosave_enabled and conversation.autosave is None:
+            conversation.attach_autosave(autosave.AutosaveLog(session_id))
+        return conversation
+
+    def _detach_autosave(self, conversation):
+        log = conversation.autosave
+        if log is not None:
+            conversation.attach_autosave(None)
+            log.close()
+
+    def _spill(self, session_id, conversation):
+        epoch, generation, messages = conversation.snapshot()
+        self.storage.save_messages(SESSION, session_id, messages, generation, epoch)
+        with self._lock:
+            if self._spilling.get(session_id) is conversation:
+                del self._spilling[session_id]
+        logging.debug("Session %s spilled to %s", session_id, self.storage.transcript_location(SESSION, session_id))
+
+    def _restore(self, session_id):
+        # Runs without self._lock; a session still being spilled is taken over by _checkout instead.
+        if self.autosave_enabled:
+            # The autosave log is never older than the spilled copy.
+            try:
+                return Conversation.from_messages(autosave.restore(session_id))
+            except RecordNotFound:
+                pass
+            except (OSError, ValueError, KeyError) as exc:
+                logging.warning("Unable to restore session %s from its autosave: %s", session_id, exc)
+        try:
+            messages = self.storage.load_messages(SESSION, session_id)
+        except RecordNotFound:
+            return self.conversation_factory()
+        except (OSError, ValueError) as exc:
+            logging.warning("Unable to restore session %s: %s", session_id, exc)
+            return self.conversation_factory()
+        logging.debug("Session %s restored", session_id)
+        return Conversation.from_messages(messages)
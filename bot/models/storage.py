@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from bot.models.character import CHARACTERS_DIR, character_path, write_json_atomic
+
+load_dotenv()
+
+# "json" keeps everything in loose files; "sqlite" uses one embedded database.
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json').lower()
+STORAGE_DB_PATH = Path(os.getenv('STORAGE_DB_PATH', 'data/dungeonmaster.db'))
+SAVED_GAMES_DIR = Path(os.getenv('SAVED_GAMES_DIR', 'data/saved_games'))
+SESSION_SPILL_DIR = Path(os.getenv('SESSION_SPILL_DIR', 'data/sessions'))
+
+GAME = "game"
+SESSION = "session"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    name TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transcripts (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    epoch TEXT,
+    generation INTEGER NOT NULL,
+    message_count INTEGER NOT NULL,
+    tail_digest TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, name)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, name, seq)
+) WITHOUT ROWID;
+"""
+
+
+class RecordNotFound(LookupError):
+    pass
+
+
+def message_digest(message):
+    return hashlib.sha1(json.dumps(message, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class JsonStorage:
+    """Loose JSON files: one per character, saved game and spilled session."""
+
+    def __init__(self, characters_dir=CHARACTERS_DIR, games_dir=SAVED_GAMES_DIR, sessions_dir=SESSION_SPILL_DIR):
+        self.characters_dir = Path(characters_dir)
+        self._transcript_dirs = {GAME: Path(games_dir), SESSION: Path(sessions_dir)}
+
+    def load_character(self, name):
+        path = character_path(name, self.characters_dir)
+        if not path.exists():
+            raise RecordNotFound(f"No character named {name!r}")
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def save_characters(self, records):
+        """Write ``{name: json_text}`` records."""
+        for name, data in records.items():
+            write_json_atomic(character_path(name, self.characters_dir), data)
+
+    def transcript_dir(self, kind):
+        return self._transcript_dirs[kind]
+
+    def transcript_location(self, kind, name):
+        if kind == GAME:
+            return self.transcript_dir(kind) / f"{name}_game.json"
+        return self.transcript_dir(kind) / f"{name}.json"
+
+    def load_messages(self, kind, name):
+        path = self.transcript_location(kind, name)
+        if not path.exists():
+            raise RecordNotFound(f"No saved {kind} named {name!r}")
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def save_messages(self, kind, name, messages, generation=None, epoch=None):
+        # A JSON file can only be rewritten whole; the generation and epoch are not needed.
+        write_json_atomic(self.transcript_location(kind, name), json.dumps(messages))
+
+    def delete_messages(self, kind, name):
+        self.transcript_location(kind, name).unlink(missing_ok=True)
+
+
+class SqliteStorage:
+    """Single SQLite database in WAL mode with one connection per thread.
+
+    Transcripts are stored one row per message. Saving appends only the rows
+    added since the previous save as long as it comes from the same
+    conversation (its epoch), the generation is unchanged and the last saved
+    message still matches; a summary, trim or reload bumps the generation, a
+    restored or new conversation has a new epoch, and either way the
+    transcript is rewritten instead.
+    """
+
+    def __init__(self, path=STORAGE_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        connection = self._connection()
+        connection.executescript(_SCHEMA)
+        # Databases created before transcripts recorded the conversation epoch.
+        if "epoch" not in {column[1] for column in connection.execute("PRAGMA table_info(transcripts)")}:
+            connection.execute("ALTER TABLE transcripts ADD COLUMN epoch TEXT")
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode: transactions are opened explicitly in _transaction.
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def load_character(self, name):
+        row = self._connection().execute("SELECT data FROM characters WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise RecordNotFound(f"No character named {name!r}")
+        return json.loads(row[0])
+
+    def save_characters(self, records):
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT INTO characters (name, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(name, data, now) for name, data in records.items()],
+            )
+
+    def transcript_location(self, kind, name):
+        return f"{self.path}#{kind}/{name}"
+
+    def load_messages(self, kind, name):
+        connection = self._connection()
+        if connection.execute("SELECT 1 FROM transcripts WHERE kind = ? AND name = ?", (kind, name)).fetchone() is None:
+            raise RecordNotFound(f"No saved {kind} named {name!r}")
+        rows = connection.execute(
+            "SELECT data FROM messages WHERE kind = ? AND name = ? ORDER BY seq", (kind, name)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def save_messages(self, kind, name, messages, generation=None, epoch=None):
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT epoch, generation, message_count, tail_digest FROM transcripts WHERE kind = ? AND name = ?",
+                (kind, name),
+            ).fetchone()
+            start = 0
+            appendable = epoch is not None and generation is not None
+            if appendable and row is not None and row[:2] == (epoch, generation) and row[2] <= len(messages):
+                saved_count, tail_digest = row[2], row[3]
+                if saved_count == 0 or message_digest(messages[saved_count - 1]) == tail_digest:
+                    start = saved_count
+            if start == 0:
+                connection.execute("DELETE FROM messages WHERE kind = ? AND name = ?", (kind, name))
+            connection.executemany(
+                "INSERT INTO messages (kind, name, seq, data) VALUES (?, ?, ?, ?)",
+                [(kind, name, seq, json.dumps(message)) for seq, message in enumerate(messages[start:], start)],
+            )
+            connection.execute(
+                "INSERT INTO transcripts (kind, name, epoch, generation, message_count, tail_digest, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (kind, name) DO UPDATE SET "
+                "epoch = excluded.epoch, generation = excluded.generation, message_count = excluded.message_count, "
+                "tail_digest = excluded.tail_digest, updated_at = excluded.updated_at",
+                (
+                    kind,
+                    name,
+                    epoch,
+                    -1 if generation is None else generation,
+                    len(messages),
+                    message_digest(messages[-1]) if messages else None,
+                    time.time(),
+                ),
+            )
+        logging.debug("Saved %s %s: %d of %d messages written", kind, name, len(messages) - start, len(messages))
+
+    def delete_messages(self, kind, name):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM messages WHERE kind = ? AND name = ?", (kind, name))
+            connection.execute("DELETE FROM transcripts WHERE kind = ? AND name = ?", (kind, name))
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == "sqlite":
+        return SqliteStorage()
+    if backend == "json":
+        return JsonStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected 'json' or 'sqlite'")
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
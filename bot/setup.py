@@ -1,19 +1,26 @@
 
 
 import os
+import hashlib
 import logging
 from pathlib import Path
 from typing import Optional
 
-from openai import OpenAI
-from bot.models.conversation import Conversation
+from dotenv import load_dotenv
+
+from bot.context import get_client
+from bot.utils.manifest import file_fingerprint, load_manifest, save_manifest
+from bot.utils.rulebook_index import build_index_from_pdfs, reset_rulebook_index
 
 VECTOR_STORE_ID_PATH = Path("./dbs/documentation/vector_store_id.txt")
+load_dotenv()
 
-client = OpenAI()
+RULEBOOK_MODE = (os.getenv('RULEBOOK_MODE') or "remote").strip().lower()
 
+SYSTEM_MESSAGE = "You are Matt Mercer (GPT), the greatest dungeon master of all time. You like to play Dungeons & Dragons. Help the user create a character using the rulebook provided to you. Make sure to enforce the rules - for example, if a level 1 Wizard tries to cast a level 9 spell, don't let them. Speak in the style and tone of Matt Mercer from Critical Role."
 
-def build_vectorstore():
+
+def _ruleset_path():
     ruleset_filepath = os.getenv('RULESET_FILEPATH')
     if not ruleset_filepath:
         raise ValueError("RULESET_FILEPATH environment variable is not set.")
@@ -21,22 +28,120 @@ def build_vectorstore():
     ruleset_path = Path(ruleset_filepath)
     if not ruleset_path.exists():
         raise FileNotFoundError(f"RULESET_FILEPATH does not exist at {ruleset_path}")
+    return ruleset_path
+
+
+def _ruleset_paths():
+    paths = [_ruleset_path()]
+    for filepath in (os.getenv('CAMPAIGN_FILEPATHS') or "").split(os.pathsep):
+        if not filepath.strip():
+            continue
+        campaign_path = Path(filepath.strip())
+        if not campaign_path.exists():
+            raise FileNotFoundError(f"CAMPAIGN_FILEPATHS entry does not exist at {campaign_path}")
+        paths.append(campaign_path)
+    return paths
+
+
+def build_local_index(force=False):
+    manifest = load_manifest()
+    if force:
+        manifest.pop("local_index", None)
+    fingerprint = build_index_from_pdfs(_ruleset_paths(), manifest)
+    save_manifest(manifest)
+    reset_rulebook_index()
+    return fingerprint
+
+
+def _upload_file(path):
+    with path.open("rb") as ruleset_file:
+        return get_client().files.create(file=ruleset_file, purpose="assistants").id
+
+
+def _detach_file(vector_store_id, file_id):
+    try:
+        get_client().vector_stores.files.delete(file_id=file_id, vector_store_id=vector_store_id)
+        get_client().files.delete(file_id)
+    except Exception as exc:  # noqa: BLE001 - a stale file only costs storage
+        logging.warning("Unable to remove file %s from vector store %s: %s", file_id, vector_store_id, exc)
+
+
+def _record_vector_store(manifest, vector_store_id, files):
+    manifest["vector_store"] = {"id": vector_store_id, "files": files}
+    save_manifest(manifest)
+    VECTOR_STORE_ID_PATH.parent.mkdir(parents=True, exist_ok=True)
+    VECTOR_STORE_ID_PATH.write_text(vector_store_id)
+
+
+def build_vectorstore():
+    manifest = load_manifest()
+    ruleset_paths = _ruleset_paths()
 
     print("Building the vector database")
-    with ruleset_path.open("rb") as ruleset_file:
-        uploaded_file = client.files.create(file=ruleset_file, purpose="assistants")
+    files = {}
+    for ruleset_path in ruleset_paths:
+        files[str(ruleset_path)] = {**file_fingerprint(ruleset_path), "file_id": _upload_file(ruleset_path)}
 
-    vector_store = client.vector_stores.create(
+    vector_store = get_client().vector_stores.create(
         name="DungeonMasterBot Rulebook",
-        file_ids=[uploaded_file.id],
+        file_ids=[entry["file_id"] for entry in files.values()],
     )
 
-    VECTOR_STORE_ID_PATH.parent.mkdir(parents=True, exist_ok=True)
-    VECTOR_STORE_ID_PATH.write_text(vector_store.id)
-
+    _record_vector_store(manifest, vector_store.id, files)
     return vector_store.id
 
 
+def sync_vectorstore(vector_store_id):
+    """Upload only the rulebooks whose content changed since the manifest was written."""
+    manifest = load_manifest()
+    section = manifest.get("vector_store", {})
+    ruleset_paths = _ruleset_paths()
+
+    if section.get("id") == vector_store_id:
+        previous = section.get("files", {})
+    else:
+        # Stores built before the manifest existed hold just RULESET_FILEPATH, under an unknown file ID.
+        previous = {str(ruleset_paths[0]): {**file_fingerprint(ruleset_paths[0]), "file_id": None}}
+
+    files = {}
+    for ruleset_path in ruleset_paths:
+        key = str(ruleset_path)
+        entry = previous.get(key)
+        fingerprint = file_fingerprint(ruleset_path, entry)
+        if entry and entry["sha256"] == fingerprint["sha256"]:
+            files[key] = {**entry, **fingerprint}
+            continue
+        if entry and entry.get("file_id") is None:
+            return build_vectorstore()
+
+        print(f"Uploading changed rulebook {ruleset_path}")
+        file_id = _upload_file(ruleset_path)
+        get_client().vector_stores.files.create(vector_store_id=vector_store_id, file_id=file_id)
+        files[key] = {**fingerprint, "file_id": file_id}
+        if entry:
+            _detach_file(vector_store_id, entry["file_id"])
+
+    for key, entry in previous.items():
+        if key in files:
+            continue
+        if entry.get("file_id") is None:
+            return build_vectorstore()
+        _detach_file(vector_store_id, entry["file_id"])
+
+    if files != previous or section.get("id") != vector_store_id:
+        _record_vector_store(manifest, vector_store_id, files)
+    return vector_store_id
+
+
+def rulebook_content_hash():
+    """Digest of the rulebook contents the vector store was last synced with, per the manifest."""
+    files = load_manifest().get("vector_store", {}).get("files", {})
+    digest = hashlib.sha256()
+    for sha256 in sorted(entry["sha256"] for entry in files.values()):
+        digest.update(sha256.encode("ascii"))
+    return digest.hexdigest()[:16]
+
+
 def _load_existing_vector_store_id() -> Optional[str]:
     if not VECTOR_STORE_ID_PATH.exists():
         return None
@@ -46,7 +151,7 @@ def _load_existing_vector_store_id() -> Optional[str]:
         return None
 
     try:
-        client.vector_stores.retrieve(vector_store_id)
+        get_client().vector_stores.retrieve(vector_store_id)
         return vector_store_id
     except Exception as exc:  # noqa: BLE001 - bubbling up warning then rebuild
         logging.warning("Vector store %s invalid or unavailable: %s", vector_store_id, exc)
@@ -55,10 +160,11 @@ def _load_existing_vector_store_id() -> Optional[str]:
 def check_and_build_vectorstore():
     existing_id = _load_existing_vector_store_id()
     if existing_id:
-        return existing_id
+        return sync_vectorstore(existing_id)
     return build_vectorstore()
 
-def initialize_bot():
-    vector_store_id = check_and_build_vectorstore()
-    conversation = Conversation("You are Matt Mercer (GPT), the greatest dungeon master of all time. You like to play Dungeons & Dragons. Help the user create a character using the rulebook provided to you. Make sure to enforce the rules - for example, if a level 1 Wizard tries to cast a level 9 spell, don't let them. Speak in the style and tone of Matt Mercer from Critical Role.")
-    return conversation, vector_store_id
+def initialize_rulebook():
+    if RULEBOOK_MODE == "local":
+        build_local_index()
+        return None
+    return check_and_build_vectorstore()
@@ -0,0 +1,380 @@
+"""Benchmark the turn loop, conversation bookkeeping, character I/O and the Flask API.
+
+Model calls are answered by an in-process fake of the OpenAI client that
+waits ``--latency-ms`` and replies from ``bot.api.stub_script``: each turn
+opens with the scripted tool calls, then a text reply. Pass ``--base-url``
+to go through the real SDK against the HTTP stub instead
+(``python -m bot.api.stub_responses``). Data, logs and saves go to a
+temporary directory.
+
+    python -m bot.utils.benchmark --sessions 1,10,100 --turns 20
+
+For every suite and session count it prints throughput, p50/p99 latency and
+the memory retained per session (measured in a separate, zero-latency pass
+under tracemalloc so the timings are not skewed).
+"""
+import os
+import gc
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from bot.api.stub_script import STUB_REPLY, scripted_response, stream_events
+
+SUITES = ("turns", "conversation", "characters", "flask")
+BENCH_CHARACTER = "Bench"
+DEFAULT_TOOL_CALLS = [{"name": "update_character", "arguments": {"name": BENCH_CHARACTER, "additional_experience_points": 10}}]
+# A typical paragraph of narration.
+NARRATION = " ".join(["The goblins circle the campfire while the rogue counts their arrows."] * 20)
+
+
+def _namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+
+class _FakeStream:
+    def __init__(self, events):
+        self._events = events
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        return iter(self._events)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        for event in self._events:
+            yield event
+
+
+class _FakeResponses:
+    def __init__(self, script, latency):
+        self.script = script
+        self.latency = latency
+
+    def _respond(self, kwargs):
+        response = scripted_response(kwargs, **self.script)
+        if kwargs.get("stream"):
+            return _FakeStream([_namespace(event) for _, event in stream_events(response)])
+        return _namespace(response)
+
+    def create(self, **kwargs):
+        time.sleep(self.latency)
+        return self._respond(kwargs)
+
+
+class _FakeAsyncResponses(_FakeResponses):
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._respond(kwargs)
+
+
+class FakeOpenAI:
+    """Just enough of ``OpenAI``/``AsyncOpenAI`` for ``responses.create``.
+
+    Responses are plain attribute namespaces rather than SDK models, so SDK
+    parsing is not part of the measurement; use ``--base-url`` for that.
+    """
+
+    def __init__(self, script, latency=0.0, asynchronous=False):
+        self.responses = (_FakeAsyncResponses if asynchronous else _FakeResponses)(script, latency)
+
+    async def close(self):
+        pass
+
+
+def _configure_environment(directory, base_url):
+    # Must run before bot modules are imported: they read these at import time.
+    # Paths are always overridden (a .env loaded later never replaces them),
+    # so a benchmark can never write into the real data or log directories.
+    paths = {
+        "CHARACTERS_DIR": os.path.join(directory, "characters"),
+        "SAVED_GAMES_DIR": os.path.join(directory, "saved_games"),
+        "SESSION_SPILL_DIR": os.path.join(directory, "sessions"),
+        "STORAGE_DB_PATH": os.path.join(directory, "dungeonmaster.db"),
+        "AUTOSAVE_DIR": os.path.join(directory, "autosave"),
+        "LOG_FILE": os.path.join(directory, "logs", "debug.log"),
+        "SUMMARY_LOG_FILE": os.path.join(directory, "logs", "summaries.log"),
+    }
+    os.environ.update(paths)
+    defaults = {
+        "GPT_MODEL": "gpt-4o",
+        "OPENAI_API_KEY": "benchmark",
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+    os.makedirs(os.environ["CHARACTERS_DIR"], exist_ok=True)
+    if base_url:
+        os.environ["OPENAI_BASE_URL"] = base_url
+
+
+def _install_fake(script, latency):
+    from bot.context import get_context
+
+    get_context().use_clients(FakeOpenAI(script, latency), FakeOpenAI(script, latency, asynchronous=True))
+
+
+def _bench_character():
+    from bot.models.character import Character
+
+    return Character(
+        name=BENCH_CHARACTER, character_class="Wizard", race="Elf", level=1, background="Sage",
+        alignment="Neutral Good", experience_points=0, strength=8, dexterity=14, constitution=12,
+        intelligence=16, wisdom=12, charisma=10, proficiency_bonus=2, skills=["Arcana"],
+        saving_throws=["Intelligence", "Wisdom"], max_hit_points=8, hit_dice="1d6",
+        death_saves={"successes": 0, "failures": 0}, equipment=["Spellbook"], spells=["Magic Missile"],
+        languages=["Common", "Elvish"], features_and_traits=["Darkvision"], notes="",
+    )
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _result(suite, operation, sessions, samples, elapsed, memory=None):
+    return {
+        "suite": suite,
+        "operation": operation,
+        "sessions": sessions,
+        "ops": len(samples),
+        "ops_per_second": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(samples, 0.50) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "kib_per_session": memory,
+    }
+
+
+def _timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def _run_concurrently(sessions, worker):
+    """Run ``worker(index)`` once per session in parallel; returns (latencies, elapsed)."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(worker, range(sessions)))
+    return [latency for latencies in results for latency in latencies], time.perf_counter() - started
+
+
+def _retained_kib(sessions, workload):
+    """Memory still allocated after ``workload`` ran, per session, in KiB."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = workload()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return (after - before) / 1024 / sessions
+
+
+def bench_turns(session_counts, turns, options):
+    from bot import main
+
+    results = []
+    for sessions in session_counts:
+        def worker(index, prefix=f"turns-{sessions}"):
+            return [_timed(main.process_message, "I search the room.", f"{prefix}-{index}") for _ in range(turns)]
+
+        latencies, elapsed = _run_concurrently(sessions, worker)
+        memory = None
+        if options.memory:
+            _install_fake(options.script, 0.0)
+
+            def workload(prefix=f"turns-mem-{sessions}"):
+                _run_concurrently(sessions, lambda index: [
+                    _timed(main.process_message, "I search the room.", f"{prefix}-{index}") for _ in range(turns)
+                ])
+                return main.sessions
+
+            memory = _retained_kib(sessions, workload)
+            _install_fake(options.script, options.latency)
+        results.append(_result("turns", "process_message", sessions, latencies, elapsed, memory))
+    return results
+
+
+def bench_conversation(session_counts, turns, options):
+    from bot.models.conversation import CONTEXT_LIMIT, Conversation
+    from bot.setup import SYSTEM_MESSAGE
+
+    response = _namespace(scripted_response({"input": [{"role": "assistant"}]}, reply=NARRATION, tool_calls=()))
+    results = []
+    for sessions in session_counts:
+        conversations = [Conversation(SYSTEM_MESSAGE) for _ in range(sessions)]
+        add_samples, get_samples = [], []
+        started = time.perf_counter()
+        for turn in range(turns):
+            for conversation in conversations:
+                add_samples.append(_timed(conversation.add_user_message, f"Turn {turn}: I listen at the door."))
+                add_samples.append(_timed(conversation.add_assistant_response, response))
+                add_samples.append(_timed(conversation.add_function_message, "get_character_state", f"call_{turn}", "{}"))
+                get_samples.append(_timed(conversation.get_messages))
+        elapsed = time.perf_counter() - started
+        memory = None
+        if options.memory:
+            def workload():
+                built = [Conversation(SYSTEM_MESSAGE) for _ in range(sessions)]
+                for turn in range(turns):
+                    for conversation in built:
+                        conversation.add_user_message(f"Turn {turn}: I listen at the door.")
+                        conversation.add_assistant_response(response)
+                return built
+
+            memory = _retained_kib(sessions, workload)
+        results.append(_result("conversation", "add_*", sessions, add_samples, elapsed, memory))
+        results.append(_result("conversation", "get_messages", sessions, get_samples, elapsed))
+
+        # Fill fresh conversations past the point where the oldest chunk is worth summarizing.
+        summary_samples = []
+        elapsed = 0.0
+        for _ in range(sessions):
+            conversation = Conversation(SYSTEM_MESSAGE)
+            while conversation.token_total < CONTEXT_LIMIT / 6:
+                conversation.add_user_message("I listen at the door.")
+                conversation.add_assistant_response(response)
+            summary_samples.append(_timed(conversation._summarize))
+            elapsed += summary_samples[-1]
+        results.append(_result("conversation", "_summarize", sessions, summary_samples, elapsed))
+    return results
+
+
+def bench_characters(session_counts, turns, options):
+    from bot.models.character import Character
+
+    template = _bench_character()
+    results = []
+    for sessions in session_counts:
+        names = [f"Bench{sessions}x{index}" for index in range(sessions)]
+        save_samples, load_samples = [], []
+        started = time.perf_counter()
+        for _ in range(turns):
+            for name in names:
+                character = template.copy()
+                character.name = name
+                save_samples.append(_timed(character.save))
+        save_elapsed = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(turns):
+            for name in names:
+                load_samples.append(_timed(Character.load, name))
+        load_elapsed = time.perf_counter() - started
+        results.append(_result("characters", "save", sessions, save_samples, save_elapsed))
+        results.append(_result("characters", "load", sessions, load_samples, load_elapsed))
+    return results
+
+
+def bench_flask(session_counts, turns, options):
+    from bot.api.server import app
+
+    results = []
+    for sessions in session_counts:
+        def worker(index, prefix=f"flask-{sessions}"):
+            client = app.test_client()
+            payload = {"user_input": "I open the chest.", "session_id": f"{prefix}-{index}"}
+            return [_timed(client.post, "/chat", json=payload) for _ in range(turns)]
+
+        latencies, elapsed = _run_concurrently(sessions, worker)
+        results.append(_result("flask", "POST /chat", sessions, latencies, elapsed))
+
+        client = app.test_client()
+        scrapes = [_timed(client.get, "/metrics") for _ in range(turns)]
+        results.append(_result("flask", "GET /metrics", sessions, scrapes, sum(scrapes)))
+    return results
+
+
+BENCHMARKS = {
+    "turns": bench_turns,
+    "conversation": bench_conversation,
+    "characters": bench_characters,
+    "flask": bench_flask,
+}
+
+
+def format_table(results):
+    header = f"{'suite':<13}{'operation':<17}{'sessions':>9}{'ops':>8}{'ops/s':>11}{'p50 ms':>10}{'p99 ms':>10}{'KiB/session':>13}"
+    lines = [header, "-" * len(header)]
+    for row in results:
+        memory = "" if row["kib_per_session"] is None else f"{row['kib_per_session']:.1f}"
+        lines.append(
+            f"{row['suite']:<13}{row['operation']:<17}{row['sessions']:>9}{row['ops']:>8}"
+            f"{row['ops_per_second']:>11.1f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}{memory:>13}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DungeonMasterBot against a scripted Responses API.")
+    parser.add_argument("--sessions", default="1,10,100", help="comma-separated session counts (default: 1,10,100)")
+    parser.add_argument("--turns", type=int, default=10, help="turns (or operations) per session (default: 10)")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="fake model latency per call (default: 200)")
+    parser.add_argument(
+        "--tool-calls", default=json.dumps(DEFAULT_TOOL_CALLS),
+        help='JSON list of {"name", "arguments"} calls opening each turn; "[]" for text-only turns',
+    )
+    parser.add_argument("--reply", default=STUB_REPLY, help="text the fake model answers with")
+    parser.add_argument("--cached-ratio", type=float, default=0.0, help="share of input tokens reported as cached")
+    parser.add_argument("--base-url", help="call a running Responses API stub over HTTP instead of the in-process fake")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    session_counts = [int(count) for count in args.sessions.split(",") if count]
+    suites = [suite for suite in args.suites.split(",") if suite]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    directory = tempfile.mkdtemp(prefix="dmbot-bench-")
+    _configure_environment(directory, args.base_url)
+    options = SimpleNamespace(
+        script={"reply": args.reply, "tool_calls": json.loads(args.tool_calls), "cached_ratio": args.cached_ratio},
+        latency=args.latency_ms / 1000,
+        memory=args.memory and not args.base_url,
+    )
+    if not args.base_url:
+        _install_fake(options.script, options.latency)
+
+    from bot import main as bot_main
+
+    bot_main.characters.add(_bench_character())
+
+    results = []
+    for suite in suites:
+        results.extend(BENCHMARKS[suite](session_counts, args.turns, options))
+        bot_main.characters.flush()
+    print(format_table(results))
+    print(f"\nData written under {directory}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
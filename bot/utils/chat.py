@@ -1,39 +1,38 @@
-import json
-import logging
-import os
+import time
 from typing import Any, Dict, List
 
 from dotenv import load_dotenv
-from openai import OpenAI
-from tenacity import retry, wait_random_exponential, stop_after_attempt
+from tenacity import retry, retry_if_exception, wait_random_exponential, stop_after_attempt
 
+from bot.context import get_async_client, get_client
 from bot.utils.functions import FUNCTIONS
+from bot.utils.logs import Payload, payload_logger
+from bot.utils.metrics import model_call_errors, model_call_seconds, record_usage
+from bot.utils.routing import NARRATION, router
 
 load_dotenv()  # take environment variables from .env
 
-logging.basicConfig(
-    filename='logs/debug.log',
-    level=logging.DEBUG,
-    format='%(asctime)s:%(levelname)s:%(message)s',
-    datefmt='%H:%M:%S'
-)
+# Client errors that can succeed on a second try; any other 4xx (such as a
+# previous_response_id the server no longer holds) fails the same way every time.
+_RETRYABLE_CLIENT_ERRORS = {408, 409, 429}
 
-GPT_MODEL = os.getenv('GPT_MODEL')
-RAW_REASONING_EFFORT = (os.getenv('REASONING_EFFORT') or "").strip().lower()
-_DISABLED_REASONING_VALUES = {"", "none", "off", "disable", "disabled"}
-_ALLOWED_REASONING_EFFORTS = {"low", "medium", "high"}
 
+def _is_transient(exc) -> bool:
+    status = getattr(exc, "status_code", None)
+    return not (status and 400 <= status < 500 and status not in _RETRYABLE_CLIENT_ERRORS)
 
-def _resolve_reasoning_effort() -> Dict[str, str] | None:
-    if RAW_REASONING_EFFORT in _ALLOWED_REASONING_EFFORTS:
-        return {"effort": RAW_REASONING_EFFORT}
-    if RAW_REASONING_EFFORT in _DISABLED_REASONING_VALUES:
-        return {"effort": "minimal"}
-    if RAW_REASONING_EFFORT:
-        logging.warning("Ignoring unsupported REASONING_EFFORT value '%s'", RAW_REASONING_EFFORT)
-    return {"effort": "minimal"}
 
-client = OpenAI()
+# Formatted tool definitions keyed by the id of the function list they came from.
+_tool_definitions_cache: Dict[int, tuple] = {}
+
+
+def _tool_definitions(functions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Format ``functions`` once and reuse the result, keeping the tools prefix byte-stable."""
+    cached = _tool_definitions_cache.get(id(functions))
+    if cached is None or cached[0] is not functions:
+        cached = (functions, _format_tools(functions))
+        _tool_definitions_cache[id(functions)] = cached
+    return cached[1]
 
 
 def _format_tools(functions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -79,27 +78,181 @@ def extract_total_tokens(response) -> int | None:
     return getattr(usage, "total_tokens", None)
 
 
-@retry(wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+def extract_input_tokens(response) -> int | None:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    return getattr(usage, "input_tokens", None)
+
+
+def extract_cached_tokens(response) -> int | None:
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "input_tokens_details", None)
+    if details is None:
+        return None
+    return getattr(details, "cached_tokens", None)
+
+
+def _build_request_kwargs(
+    messages, functions, model, tool_choice, prompt_cache_key=None, reasoning=None, previous_response_id=None
+) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {"model": model, "input": messages}
+    if previous_response_id:
+        # The server already holds everything up to that response; ``messages`` only has what came after.
+        kwargs["previous_response_id"] = previous_response_id
+    if reasoning:
+        kwargs["reasoning"] = reasoning
+    tool_definitions = _tool_definitions(functions) if functions else []
+    if tool_definitions:
+        kwargs["tools"] = tool_definitions
+        kwargs["tool_choice"] = tool_choice
+    if prompt_cache_key:
+        # Routes requests that share a prefix to the same cache shard.
+        kwargs["prompt_cache_key"] = prompt_cache_key
+    return kwargs
+
+
+def _route_request(messages, functions, model, tool_choice, prompt_cache_key, route, previous_response_id):
+    # Selected per attempt, so a retry after a slow failure can already go to the fallback model.
+    route_model, reasoning = router.select(route)
+    model = model or route_model
+    return model, _build_request_kwargs(
+        messages, functions, model, tool_choice, prompt_cache_key, reasoning, previous_response_id
+    )
+
+
+@retry(retry=retry_if_exception(_is_transient), wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
 def chat_completion_request(
     messages,
     functions: List[Dict[str, Any]] = FUNCTIONS,
-    model: str | None = GPT_MODEL,
+    model: str | None = None,
     tool_choice: str = "auto",
+    prompt_cache_key: str | None = None,
+    route: str = NARRATION,
+    previous_response_id: str | None = None,
 ):
-    logging.debug(json.dumps(messages))
+    payload_logger.debug("Responses API input: %s", Payload(messages))
     try:
-        kwargs: Dict[str, Any] = {"model": model, "input": messages}
-        reasoning_effort = _resolve_reasoning_effort()
-        if reasoning_effort:
-            kwargs["reasoning"] = reasoning_effort
-        tool_definitions = _format_tools(functions) if functions else []
-        if tool_definitions:
-            kwargs["tools"] = tool_definitions
-            kwargs["tool_choice"] = tool_choice
-        response = client.responses.create(**kwargs)
-        logging.debug(response.model_dump())
+        model, kwargs = _route_request(
+            messages, functions, model, tool_choice, prompt_cache_key, route, previous_response_id
+        )
+        with model_call_seconds.time(model=model or "", mode="sync"), router.timed(route, model):
+            response = get_client().responses.create(**kwargs)
+        record_usage(model, response)
+        payload_logger.debug("Responses API output: %s", Payload(response))
         return response
     except Exception as e:  # noqa: BLE001 - exit to surface configuration error quickly
+        model_call_errors.inc(model=model or "", mode="sync")
         print("Unable to generate response via OpenAI Responses API")
         print(f"Exception: {e}")
         raise
+
+
+@retry(retry=retry_if_exception(_is_transient), wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+async def async_chat_completion_request(
+    messages,
+    functions: List[Dict[str, Any]] = FUNCTIONS,
+    model: str | None = None,
+    tool_choice: str = "auto",
+    prompt_cache_key: str | None = None,
+    route: str = NARRATION,
+    previous_response_id: str | None = None,
+):
+    payload_logger.debug("Responses API input: %s", Payload(messages))
+    try:
+        model, kwargs = _route_request(
+            messages, functions, model, tool_choice, prompt_cache_key, route, previous_response_id
+        )
+        with model_call_seconds.time(model=model or "", mode="async"), router.timed(route, model):
+            response = await get_async_client().responses.create(**kwargs)
+        record_usage(model, response)
+        payload_logger.debug("Responses API output: %s", Payload(response))
+        return response
+    except Exception as e:  # noqa: BLE001 - exit to surface configuration error quickly
+        model_call_errors.inc(model=model or "", mode="async")
+        print("Unable to generate response via OpenAI Responses API")
+        print(f"Exception: {e}")
+        raise
+
+
+@retry(retry=retry_if_exception(_is_transient), wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+def _open_response_stream(kwargs: Dict[str, Any]):
+    return get_client().responses.create(stream=True, **kwargs)
+
+
+@retry(retry=retry_if_exception(_is_transient), wait=wait_random_exponential(min=1, max=40), stop=stop_after_attempt(3))
+async def _open_async_response_stream(kwargs: Dict[str, Any]):
+    return await get_async_client().responses.create(stream=True, **kwargs)
+
+
+def stream_chat_completion_request(
+    messages,
+    functions: List[Dict[str, Any]] = FUNCTIONS,
+    model: str | None = None,
+    tool_choice: str = "auto",
+    prompt_cache_key: str | None = None,
+    route: str = NARRATION,
+    previous_response_id: str | None = None,
+):
+    """Yield Responses API stream events; only opening the stream is retried."""
+    payload_logger.debug("Responses API input: %s", Payload(messages))
+    model, kwargs = _route_request(
+        messages, functions, model, tool_choice, prompt_cache_key, route, previous_response_id
+    )
+    started = time.perf_counter()
+    try:
+        # Streams are held to the SLO on time to first byte; their length depends on the reply.
+        with router.timed(route, model):
+            stream = _open_response_stream(kwargs)
+        with stream:
+            for event in stream:
+                if getattr(event, "type", None) in _FINAL_STREAM_EVENTS:
+                    record_usage(model, event.response)
+                yield event
+    except Exception:
+        model_call_errors.inc(model=model or "", mode="stream")
+        raise
+    finally:
+        model_call_seconds.observe(time.perf_counter() - started, model=model or "", mode="stream")
+
+
+async def async_stream_chat_completion_request(
+    messages,
+    functions: List[Dict[str, Any]] = FUNCTIONS,
+    model: str | None = None,
+    tool_choice: str = "auto",
+    prompt_cache_key: str | None = None,
+    route: str = NARRATION,
+    previous_response_id: str | None = None,
+):
+    payload_logger.debug("Responses API input: %s", Payload(messages))
+    model, kwargs = _route_request(
+        messages, functions, model, tool_choice, prompt_cache_key, route, previous_response_id
+    )
+    started = time.perf_counter()
+    try:
+        with router.timed(route, model):
+            stream = await _open_async_response_stream(kwargs)
+        async with stream:
+            async for event in stream:
+                if getattr(event, "type", None) in _FINAL_STREAM_EVENTS:
+                    record_usage(model, event.response)
+                yield event
+    except Exception:
+        model_call_errors.inc(model=model or "", mode="async_stream")
+        raise
+    finally:
+        model_call_seconds.observe(time.perf_counter() - started, model=model or "", mode="async_stream")
+
+
+_FINAL_STREAM_EVENTS = {"response.completed", "response.incomplete"}
+
+
+def final_stream_response(event):
+    """Return the finished response carried by a terminal stream event, if any."""
+    event_type = getattr(event, "type", None)
+    if event_type in _FINAL_STREAM_EVENTS:
+        return event.response
+    if event_type in ("response.failed", "error"):
+        raise RuntimeError(f"Responses API stream failed: {event}")
+    return None
@@ -0,0 +1,102 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+# Guards against expressions that would allocate absurd arrays.
+MAX_DICE = 1000
+MAX_SIDES = 1000
+# Dice held in memory at once while rolling many totals; larger rolls go in blocks of rows.
+_CHUNK_DICE = 1 << 20
+
+ADVANTAGE = "advantage"
+DISADVANTAGE = "disadvantage"
+NORMAL = "normal"
+
+_TERM = re.compile(r"\s*([+-])?\s*(?:(\d*)\s*d\s*(\d+)(?:\s*k\s*([hl])\s*(\d+))?|(\d+))\s*", re.IGNORECASE)
+
+
+class DiceTerm(NamedTuple):
+    sign: int
+    count: int
+    sides: int
+    # Keep only the ``keep`` highest ("h") or lowest ("l") dice, as in 4d6kh3.
+    keep_mode: str | None
+    keep: int
+
+
+class DiceExpression:
+    """A parsed expression such as ``2d6+3``, ``1d20-1`` or ``4d6kh3``, rolled in bulk with NumPy."""
+
+    __slots__ = ("text", "terms", "modifier")
+
+    def __init__(self, text: str, terms: Tuple[DiceTerm, ...], modifier: int):
+        self.text = text
+        self.terms = terms
+        self.modifier = modifier
+
+    @property
+    def dice_count(self) -> int:
+        return sum(term.count for term in self.terms)
+
+    def roll(self, rng: np.random.Generator, size: int = 1, mode: str = NORMAL, dice_only: bool = False) -> np.ndarray:
+        """Return ``size`` independent totals as an int64 array.
+
+        With advantage or disadvantage, every single d20 is rolled twice and
+        the higher or lower result kept. ``dice_only`` leaves out the flat
+        modifier, e.g. for the extra dice of a critical hit.
+        """
+        totals = np.zeros(size, dtype=np.int64)
+        if not dice_only and self.modifier:
+            totals += self.modifier
+        for term in self.terms:
+            if term.sides == 20 and term.count == 1 and term.keep_mode is None and mode != NORMAL:
+                pair = rng.integers(1, 21, size=(size, 2))
+                values = pair.max(axis=1) if mode == ADVANTAGE else pair.min(axis=1)
+            else:
+                values = np.empty(size, dtype=np.int64)
+                step = max(1, _CHUNK_DICE // term.count)
+                for start in range(0, size, step):
+                    dice = rng.integers(1, term.sides + 1, size=(min(step, size - start), term.count))
+                    if term.keep_mode is not None:
+                        dice.sort(axis=1)
+                        dice = dice[:, -term.keep:] if term.keep_mode == "h" else dice[:, :term.keep]
+                    values[start:start + step] = dice.sum(axis=1)
+            totals += term.sign * values
+        return totals
+
+    def __repr__(self):
+        return f"DiceExpression({self.text!r})"
+
+
+@lru_cache(maxsize=256)
+def parse(expression: str) -> DiceExpression:
+    text = expression.strip()
+    position = 0
+    terms = []
+    modifier = 0
+    while position < len(text):
+        match = _TERM.match(text, position)
+        if match is None or match.end() == position or (terms or modifier) and not match.group(1):
+            raise ValueError(f"Could not parse dice expression {expression!r}")
+        sign = -1 if match.group(1) == "-" else 1
+        if match.group(6) is not None:
+            modifier += sign * int(match.group(6))
+        else:
+            count = int(match.group(2) or 1)
+            sides = int(match.group(3))
+            keep = int(match.group(5) or count)
+            if not 1 <= count <= MAX_DICE or not 2 <= sides <= MAX_SIDES or not 1 <= keep <= count:
+                raise ValueError(f"Dice out of range in {expression!r}")
+            terms.append(DiceTerm(sign, count, sides, (match.group(4) or "").lower() or None, keep))
+        position = match.end()
+    if not terms and not modifier:
+        raise ValueError(f"Could not parse dice expression {expression!r}")
+    if sum(term.count for term in terms) > MAX_DICE:
+        raise ValueError(f"At most {MAX_DICE} dice in total in {expression!r}")
+    return DiceExpression(text, tuple(terms), modifier)
+
+
+def roll(expression: str, times: int = 1, mode: str = NORMAL, seed=None) -> np.ndarray:
+    return parse(expression).roll(np.random.default_rng(seed), times, mode)
@@ -0,0 +1,162 @@
+"""Monte Carlo combat simulation, vectorized across fights with NumPy.
+
+Every trial is an independent fight. Combatants act in a per-trial
+initiative order; each turn a living combatant makes one attack against a
+random living enemy (natural 20 hits and rolls the damage dice twice,
+natural 1 misses). There is no movement, healing, spellcasting or death
+saves, so the numbers are a difficulty estimate rather than a forecast.
+"""
+from typing import Any, Dict, List, NamedTuple
+
+import numpy as np
+
+from bot.models.rules import ability_modifier
+from bot.utils.dice import parse
+
+MAX_TRIALS = 100000
+MAX_ROUNDS = 50
+MAX_COMBATANTS = 50
+# Cap on trials * (combatants ** 2 + 2 * damage dice): the values drawn and
+# compared in one round, which also bounds the memory a round needs.
+MAX_ROUND_WORK = 20_000_000
+PARTY = 0
+MONSTERS = 1
+
+
+class Combatant(NamedTuple):
+    name: str
+    side: int
+    hit_points: int
+    armor_class: int
+    attack_bonus: int
+    damage: str
+    initiative_bonus: int
+
+
+def character_combatant(character, armor_class=None, attack_bonus=None, damage=None) -> Combatant:
+    """A party member from a character sheet.
+
+    Sheets do not record gear, so unless given, armor class is unarmored
+    (10 + DEX) and the attack is a d8 weapon using the better of STR and DEX.
+    """
+    dexterity = ability_modifier(character.dexterity)
+    ability = max(ability_modifier(character.strength), dexterity)
+    return Combatant(
+        character.name,
+        PARTY,
+        character.current_hit_points,
+        10 + dexterity if armor_class is None else armor_class,
+        character.proficiency_bonus + ability if attack_bonus is None else attack_bonus,
+        damage or f"1d8{ability:+d}",
+        dexterity,
+    )
+
+
+def monster_combatants(monster) -> List[Combatant]:
+    """Expand ``{"name", "count", "hit_points", "armor_class", "attack_bonus", "damage", "initiative_bonus"}``."""
+    count = monster.get("count") or 1
+    # Checked before expanding: the count comes straight from the model.
+    if not 1 <= count <= MAX_COMBATANTS:
+        raise ValueError(f"count must be between 1 and {MAX_COMBATANTS}")
+    names = [monster["name"]] if count == 1 else [f"{monster['name']} {index}" for index in range(1, count + 1)]
+    return [
+        Combatant(
+            name,
+            MONSTERS,
+            monster["hit_points"],
+            monster["armor_class"],
+            monster["attack_bonus"],
+            monster["damage"],
+            monster.get("initiative_bonus") or 0,
+        )
+        for name in names
+    ]
+
+
+def simulate(combatants: List[Combatant], trials: int = 1000, seed=None) -> Dict[str, Any]:
+    if not 1 <= trials <= MAX_TRIALS:
+        raise ValueError(f"trials must be between 1 and {MAX_TRIALS}")
+    if len(combatants) > MAX_COMBATANTS:
+        raise ValueError(f"An encounter can have at most {MAX_COMBATANTS} combatants")
+    sides = np.array([combatant.side for combatant in combatants])
+    if not (sides == PARTY).any() or not (sides == MONSTERS).any():
+        raise ValueError("An encounter needs at least one party member and one monster")
+    count = len(combatants)
+    damage = [parse(combatant.damage) for combatant in combatants]
+    # Normal and critical damage dice are both rolled every round.
+    work = trials * (count * count + 2 * sum(expression.dice_count for expression in damage))
+    if work > MAX_ROUND_WORK:
+        raise ValueError(
+            f"Encounter too large to simulate: {trials} trials of {count} combatants with these damage dice; "
+            "use fewer trials, combatants or damage dice"
+        )
+    rng = np.random.default_rng(seed)
+    armor_class = np.array([combatant.armor_class for combatant in combatants])
+    attack_bonus = np.array([combatant.attack_bonus for combatant in combatants])
+    party = sides == PARTY
+    hit_points = np.tile(np.array([combatant.hit_points for combatant in combatants], dtype=np.int64), (trials, 1))
+
+    initiative = rng.integers(1, 21, size=(trials, count)) + np.array([c.initiative_bonus for c in combatants])
+    order = np.argsort(-initiative, axis=1, kind="stable")
+    enemies = sides[None, :] != sides[:, None]
+
+    rounds = np.full(trials, MAX_ROUNDS, dtype=np.int64)
+    # Only fights still in progress are carried into the next round.
+    active = np.arange(trials)
+    for round_number in range(1, MAX_ROUNDS + 1):
+        size = len(active)
+        rows = np.arange(size)
+        current = hit_points[active]
+        turn_order = order[active]
+        # Everyone's damage for the round, rolled in bulk, plus the extra dice for critical hits.
+        damage_rolls = np.stack([expression.roll(rng, size) for expression in damage], axis=1)
+        critical_rolls = np.stack([expression.roll(rng, size, dice_only=True) for expression in damage], axis=1)
+        attack_rolls = rng.integers(1, 21, size=(size, count))
+        for slot in range(count):
+            actor = turn_order[:, slot]
+            alive = current > 0
+            candidates = enemies[actor] & alive
+            can_act = alive[rows, actor] & candidates.any(axis=1)
+            target = np.where(candidates, rng.random((size, count)), -1.0).argmax(axis=1)
+            natural = attack_rolls[rows, actor]
+            hits = can_act & (natural != 1) & (
+                (natural == 20) | (natural + attack_bonus[actor] >= armor_class[target])
+            )
+            dealt = damage_rolls[rows, actor] + np.where(natural == 20, critical_rolls[rows, actor], 0)
+            current[rows, target] -= np.where(hits, np.maximum(dealt, 0), 0)
+        hit_points[active] = current
+        alive = current > 0
+        finished = ~((alive & party).any(axis=1) & (alive & ~party).any(axis=1))
+        rounds[active[finished]] = round_number
+        active = active[~finished]
+        if not len(active):
+            break
+
+    alive = hit_points > 0
+    party_wins = (alive & party).any(axis=1) & ~(alive & ~party).any(axis=1)
+    starting_hit_points = np.array([combatant.hit_points for combatant in combatants])
+    party_hit_points_left = np.clip(hit_points[:, party], 0, None).sum(axis=1) / max(starting_hit_points[party].sum(), 1)
+    members_down = (~alive[:, party]).sum(axis=1)
+    return {
+        "trials": trials,
+        "party_win_rate": round(float(party_wins.mean()), 3),
+        "average_rounds": round(float(rounds.mean()), 1),
+        "average_party_hit_points_left": round(float(party_hit_points_left.mean()), 3),
+        "average_party_members_down": round(float(members_down.mean()), 2),
+        "chance_down": {
+            combatant.name: round(float((~alive[:, index]).mean()), 3)
+            for index, combatant in enumerate(combatants)
+            if combatant.side == PARTY
+        },
+        "difficulty": _difficulty(party_wins.mean(), members_down.mean(), party_hit_points_left.mean()),
+    }
+
+
+def _difficulty(win_rate, members_down, hit_points_left):
+    if win_rate < 0.5 or members_down >= 1.5:
+        return "deadly"
+    if win_rate < 0.9 or members_down >= 0.5:
+        return "hard"
+    if hit_points_left < 0.6:
+        return "medium"
+    return "easy"
@@ -0,0 +1,71 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOOL_WORKERS = int(os.getenv('TOOL_WORKERS', '8'))
+CONVERSATION_RESOURCE = "conversation"
+
+_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+
+
+def plan_lanes(calls, resources_for):
+    """Split calls into lanes that can run concurrently.
+
+    Calls that touch a common resource land in the same lane and keep their
+    original relative order; calls with no resources each get their own lane.
+    """
+    parents = list(range(len(calls)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    owners = {}
+    for index, call in enumerate(calls):
+        for resource in resources_for(call):
+            if resource in owners:
+                parents[find(index)] = find(owners[resource])
+            else:
+                owners[resource] = index
+
+    lanes = {}
+    for index in range(len(calls)):
+        lanes.setdefault(find(index), []).append(index)
+    return list(lanes.values())
+
+
+def run_tool_calls(calls, execute, resources_for):
+    """Run ``execute(call)`` for every call and return the results in call order."""
+    lanes = plan_lanes(calls, resources_for)
+    if len(lanes) <= 1:
+        return [execute(call) for call in calls]
+
+    def run_lane(lane):
+        return [(index, execute(calls[index])) for index in lane]
+
+    results = [None] * len(calls)
+    futures = [_executor.submit(run_lane, lane) for lane in lanes]
+    for future in futures:
+        for index, result in future.result():
+            results[index] = result
+    return results
+
+
+async def run_tool_calls_async(calls, execute, resources_for):
+    """Async variant of :func:`run_tool_calls` where ``execute`` is a coroutine function."""
+    lanes = plan_lanes(calls, resources_for)
+
+    async def run_lane(lane):
+        return [(index, await execute(calls[index])) for index in lane]
+
+    results = [None] * len(calls)
+    for lane_results in await asyncio.gather(*(run_lane(lane) for lane in lanes)):
+        for index, result in lane_results:
+            results[index] = result
+    return results
@@ -77,11 +77,11 @@ FUNCTIONS = [
                 },
                 "max_hit_points": {
                     "type": "integer",
-                    "description": "The character's maximum hit points."
+                    "description": "The character's maximum hit points. Leave this out to use the maximum hit die at level 1 plus the fixed increase for each later level."
                 },
                 "proficiency_bonus": {
                     "type": "integer",
-                    "description": "The character's proficiency bonus."
+                    "description": "The character's proficiency bonus. This is always derived from the level, so it can be left out."
                 },
                 "skills": {
                     "type": "array",
@@ -101,7 +101,7 @@ FUNCTIONS = [
                 },
                 "hit_dice": {
                     "type": "string",
-                    "description": "The total number and type of hit dice the character has."
+                    "description": "The total number and type of hit dice the character has. This is always derived from the class and level, so it can be left out."
                 },
                 "death_saves": {
                     "type": "object",
@@ -150,12 +150,12 @@ FUNCTIONS = [
                     "description": "Any additional information you want to keep track of, such as the character's personal goals, NPCs they've met, or their backstory."
                 }
             },
-            "required": ["name", "character_class", "race", "level", "background", "alignment", "strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma", "max_hit_points", "proficiency_bonus", "skills", "saving_throws", "hit_dice", "death_saves", "equipment", "languages", "features_and_traits"]
+            "required": ["name", "character_class", "race", "level", "background", "alignment", "strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma", "skills", "saving_throws", "death_saves", "equipment", "languages", "features_and_traits"]
         }
     },
     {
         "name": "update_character",
-        "description": "Whenever the character gains experience, makes a death save, fails a death save, gains or loses hit points, or uses a spell - call this function to update the character's state. The return value is a serialized json object representing the character's new state.",
+        "description": "Whenever the character gains experience, makes a death save, fails a death save, gains or loses hit points, uses a spell, or gains or loses a condition - call this function to update the character's state. Gaining enough experience levels the character up automatically, including hit points, proficiency bonus, hit dice and spell slots. The return value is a serialized json object with the character's name and the fields that changed, with their new values. Call get_character_state if you need the full character sheet.",
         "parameters": {
             "type": "object",
             "properties": {
@@ -183,10 +183,144 @@ FUNCTIONS = [
                     "type": "integer",
                     "description": "When the character usees a level one spell slot, send the number of level one spell slots used in this parameter."
                 },
+                "add_conditions": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": ["Blinded", "Charmed", "Deafened", "Exhaustion", "Frightened", "Grappled", "Incapacitated", "Invisible", "Paralyzed", "Petrified", "Poisoned", "Prone", "Restrained", "Stunned", "Unconscious"]},
+                    "description": "Conditions the character gains, such as Poisoned or Prone."
+                },
+                "remove_conditions": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": ["Blinded", "Charmed", "Deafened", "Exhaustion", "Frightened", "Grappled", "Incapacitated", "Invisible", "Paralyzed", "Petrified", "Poisoned", "Prone", "Restrained", "Stunned", "Unconscious"]},
+                    "description": "Conditions that end for the character."
+                },
             },
             "required": ["name"]
         }
     },
+    {
+        "name": "lookup_class_rules",
+        "description": "Look up the class progression tables: proficiency bonus, hit dice, experience point thresholds and spell slots per spell level for a class at a level. Use this instead of consult_rulebook for these numbers; it answers instantly.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "character_class": {
+                    "type": "string",
+                    "description": "The class to look up.",
+                    "enum": ["Barbarian", "Bard", "Cleric", "Druid", "Fighter", "Monk", "Paladin", "Ranger", "Rogue", "Sorcerer", "Warlock", "Wizard"]
+                },
+                "level": {
+                    "type": "integer",
+                    "description": "The level to look up, between 1 and 20 inclusive."
+                },
+                "experience_points": {
+                    "type": "integer",
+                    "description": "An experience point total; when no level is given, the level reached with this many experience points is used."
+                },
+            },
+            "required": ["character_class"]
+        },
+    },
+    {
+        "name": "roll_dice",
+        "description": "Roll dice instead of making up results. Supports expressions like '1d20+5', '2d6+3', '1d8-1' or '4d6kh3' (keep the highest 3), and can roll the same expression many times at once. Returns the total of each roll.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "expression": {
+                    "type": "string",
+                    "description": "The dice expression to roll, like '1d20+5'."
+                },
+                "times": {
+                    "type": "integer",
+                    "description": "How many separate rolls to make, between 1 and 100. Defaults to 1."
+                },
+                "mode": {
+                    "type": "string",
+                    "description": "Roll each d20 twice and keep the higher (advantage) or lower (disadvantage) result.",
+                    "enum": ["normal", "advantage", "disadvantage"]
+                },
+            },
+            "required": ["expression"]
+        },
+    },
+    {
+        "name": "simulate_encounter",
+        "description": "Estimate how dangerous a fight is by simulating it thousands of times with the party's saved characters. Returns the party's win rate, the average number of rounds, the share of hit points the party keeps, each member's chance of going down, and a difficulty of easy, medium, hard or deadly. Use it to balance an encounter before running it.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "party": {
+                    "type": "array",
+                    "description": "The party members taking part. Each needs a saved character; armor class, attack bonus and damage default to unarmored AC and a d8 weapon if left out.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {
+                                "type": "string",
+                                "description": "The character's name."
+                            },
+                            "armor_class": {
+                                "type": "integer",
+                                "description": "The character's armor class."
+                            },
+                            "attack_bonus": {
+                                "type": "integer",
+                                "description": "The character's attack bonus with their main attack."
+                            },
+                            "damage": {
+                                "type": "string",
+                                "description": "Damage of the character's main attack as a dice expression, like '1d8+3'."
+                            },
+                        },
+                        "required": ["name"]
+                    }
+                },
+                "monsters": {
+                    "type": "array",
+                    "description": "The monsters in the encounter.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "name": {
+                                "type": "string",
+                                "description": "The monster's name, like 'Goblin'."
+                            },
+                            "count": {
+                                "type": "integer",
+                                "description": "How many of this monster there are. Defaults to 1."
+                            },
+                            "hit_points": {
+                                "type": "integer",
+                                "description": "Hit points of each monster."
+                            },
+                            "armor_class": {
+                                "type": "integer",
+                                "description": "Armor class of each monster."
+                            },
+                            "attack_bonus": {
+                                "type": "integer",
+                                "description": "Attack bonus of the monster's main attack."
+                            },
+                            "damage": {
+                                "type": "string",
+                                "description": "Damage of the monster's main attack as a dice expression, like '1d6+2'."
+                            },
+                            "initiative_bonus": {
+                                "type": "integer",
+                                "description": "The monster's initiative bonus, usually its DEX modifier."
+                            },
+                        },
+                        "required": ["name", "hit_points", "armor_class", "attack_bonus", "damage"]
+                    }
+                },
+                "trials": {
+                    "type": "integer",
+                    "description": "How many fights to simulate. Defaults to 2000."
+                },
+            },
+            "required": ["party", "monsters"]
+        },
+    },
     {
         "name": "save_game",
         "description": "This function should be called when the user indicates they want to save the game state.",
@@ -217,7 +351,7 @@ FUNCTIONS = [
     },
     {
         "name": "get_character_state",
-        "description": "This function should be called at any time that you need to reference a player character's state. It will return a serialized json object representing the character. You can call this function silently without letting the user know if at any time the character's state leaves your context and you need to refresh it.",
+        "description": "This function should be called at any time that you need to reference a player character's state. It will return a serialized json object representing the character. You can call this function silently without letting the user know if at any time the character's state leaves your context and you need to refresh it. Hit points, experience, spell slots, death saves and conditions of the party are already sent with every request under \"Current party state\", so only call this for other fields.",
         "parameters": {
             "type": "object",
             "properties": {
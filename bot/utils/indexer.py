@@ -1,11 +1,19 @@
-from dotenv import load_dotenv
+import argparse
 
-from bot.setup import build_vectorstore
+from bot.setup import RULEBOOK_MODE, build_local_index, build_vectorstore, check_and_build_vectorstore
 
 
 def main():
-    load_dotenv()
-    build_vectorstore()
+    parser = argparse.ArgumentParser(description="Build or refresh the rulebook index.")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest and rebuild from scratch.")
+    args = parser.parse_args()
+
+    if RULEBOOK_MODE == "local":
+        build_local_index(force=args.rebuild)
+    elif args.rebuild:
+        build_vectorstore()
+    else:
+        check_and_build_vectorstore()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+import os
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = Path(os.getenv('LOG_FILE') or BASE_DIR / "logs/debug.log")
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+# Request/response payloads are cut to this many characters and only a share of them is logged.
+LOG_PAYLOAD_CHARS = int(os.getenv('LOG_PAYLOAD_CHARS', '2000'))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '1.0'))
+
+LOG_FORMAT = '%(asctime)s:%(levelname)s:%(threadName)s:%(message)s'
+LOG_DATE_FORMAT = '%H:%M:%S'
+
+# Full request and response bodies go through this logger so they can be tuned separately.
+payload_logger = logging.getLogger("dmbot.payload")
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+class Payload:
+    """Log argument that is only serialized if the record is actually emitted.
+
+    ``value`` may be a callable producing the payload, so that even building
+    it is skipped when DEBUG is off. Serialization stops after ``limit``
+    characters, so a long history costs the same as a short one.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = LOG_PAYLOAD_CHARS if limit is None else limit
+
+    def __str__(self):
+        value = self.value() if callable(self.value) else self.value
+        if hasattr(value, "model_dump"):
+            value = value.model_dump()
+        parts = []
+        size = 0
+        for chunk in json.JSONEncoder(default=str).iterencode(value):
+            parts.append(chunk)
+            size += len(chunk)
+            if size > self.limit:
+                return "".join(parts)[:self.limit] + " ...[truncated]"
+        return "".join(parts)
+
+
+class SamplingFilter(logging.Filter):
+    """Let through roughly ``rate`` of the records; the rest are dropped before formatting."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that enqueues the record as is, so the listener thread formats it.
+
+    The stock ``prepare`` merges the arguments into the message on the
+    caller's thread, which would serialize every :class:`Payload` there.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(level=LOG_LEVEL, log_file=LOG_FILE):
+    """Route all logging through a queue to a rotating file; safe to call more than once.
+
+    Callers only enqueue records; a background listener thread formats them and does the file I/O.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        log_file = Path(log_file)
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        file_handler = RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(DeferredQueueHandler(log_queue))
+        payload_logger.addFilter(SamplingFilter(LOG_PAYLOAD_SAMPLE_RATE))
+
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
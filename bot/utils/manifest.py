@@ -0,0 +1,56 @@
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+
+# Lives next to vector_store_id.txt and records what each index was built from.
+MANIFEST_PATH = Path("./dbs/documentation/manifest.json")
+MANIFEST_VERSION = 1
+
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def load_manifest(path=MANIFEST_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {"version": MANIFEST_VERSION}
+    try:
+        manifest = json.loads(path.read_text())
+    except ValueError as exc:
+        logging.warning("Ignoring unreadable manifest %s: %s", path, exc)
+        return {"version": MANIFEST_VERSION}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION}
+    return manifest
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp_path, path)
+
+
+def file_fingerprint(path, previous=None):
+    """Return ``{"sha256", "size", "mtime_ns"}`` for ``path``.
+
+    The file is only re-hashed when its size or modification time differ from
+    ``previous``, so unchanged rulebooks cost a single ``stat`` call.
+    """
+    stat = Path(path).stat()
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        return {"sha256": previous["sha256"], "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return {"sha256": digest.hexdigest(), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def page_digest(page):
+    contents = page.get_contents()
+    data = contents.get_data() if contents is not None else b""
+    return hashlib.sha256(data).hexdigest()
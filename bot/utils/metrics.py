@@ -0,0 +1,231 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds; sized for model calls (hundreds of ms to a minute).
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+ROUND_BUCKETS = (1, 2, 3, 4, 6, 8, 12)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (plus +Inf), then sum.
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text exposition format.
+
+    Besides counters and histograms, callers can register collectors: callables
+    returning ``{name: (type, help_text, value)}`` that are read at scrape time,
+    such as the rulebook cache statistics.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = Counter(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:  # noqa: BLE001 - one broken collector must not break the scrape
+                logging.exception("Metrics collector failed")
+                continue
+            for name, (metric_type, help_text, value) in samples.items():
+                lines.extend((f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {_format_value(value)}"))
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+model_call_seconds = metrics.histogram(
+    "dmbot_model_call_seconds", "Latency of Responses API calls.", labels=("model", "mode")
+)
+model_call_errors = metrics.counter(
+    "dmbot_model_call_errors_total", "Responses API calls that raised.", labels=("model", "mode")
+)
+model_fallbacks = metrics.counter(
+    "dmbot_model_fallbacks_total", "Times a route switched to its fallback model after missing its latency SLO.",
+    labels=("route",)
+)
+tokens = metrics.counter(
+    "dmbot_tokens_total", "Tokens reported in Responses API usage.", labels=("model", "kind")
+)
+turn_seconds = metrics.histogram("dmbot_turn_seconds", "End-to-end latency of a player turn.", labels=("mode",))
+turn_rounds = metrics.histogram(
+    "dmbot_turn_model_rounds", "Model calls needed to finish a turn.", labels=("mode",), buckets=ROUND_BUCKETS
+)
+tool_seconds = metrics.histogram("dmbot_tool_seconds", "Latency of tool calls.", labels=("tool", "outcome"))
+summary_seconds = metrics.histogram(
+    "dmbot_summary_seconds", "Latency of background history summarization.", labels=("outcome",)
+)
+pruned_tokens = metrics.counter(
+    "dmbot_pruned_tool_output_tokens_total", "Tokens of superseded tool outputs replaced with stubs.", labels=("tool",)
+)
+
+
+def record_usage(model, response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    model = model or ""
+    input_tokens = getattr(usage, "input_tokens", None) or 0
+    output_tokens = getattr(usage, "output_tokens", None) or 0
+    details = getattr(usage, "input_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    tokens.inc(input_tokens, model=model, kind="input")
+    tokens.inc(output_tokens, model=model, kind="output")
+    tokens.inc(cached_tokens, model=model, kind="cached")
+
+
+class TurnSpan:
+    """Timing and token totals for one player turn, logged as one JSON line when it ends."""
+
+    __slots__ = ("mode", "started", "rounds", "tool_calls", "input_tokens", "output_tokens", "cached_tokens")
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.rounds = 0
+        self.tool_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+
+    def add_response(self, response):
+        self.rounds += 1
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.input_tokens += getattr(usage, "input_tokens", None) or 0
+        self.output_tokens += getattr(usage, "output_tokens", None) or 0
+        details = getattr(usage, "input_tokens_details", None)
+        self.cached_tokens += getattr(details, "cached_tokens", None) or 0
+
+    def add_tool_calls(self, count):
+        self.tool_calls += count
+
+    def finish(self, outcome):
+        seconds = time.perf_counter() - self.started
+        turn_seconds.observe(seconds, mode=self.mode)
+        turn_rounds.observe(self.rounds, mode=self.mode)
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("turn %s", json.dumps({
+                "mode": self.mode,
+                "outcome": outcome,
+                "seconds": round(seconds, 3),
+                "rounds": self.rounds,
+                "tool_calls": self.tool_calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cached_tokens": self.cached_tokens,
+            }))
+
+
+@contextmanager
+def turn_span(mode):
+    span = TurnSpan(mode)
+    try:
+        yield span
+    except BaseException:
+        span.finish("error")
+        raise
+    span.finish("ok")
@@ -0,0 +1,48 @@
+import argparse
+
+from dotenv import load_dotenv
+
+from bot.models.storage import (
+    GAME,
+    SESSION,
+    STORAGE_DB_PATH,
+    JsonStorage,
+    SqliteStorage,
+)
+
+
+def migrate(source, target):
+    """Copy every character, saved game and spilled session from ``source`` into ``target``."""
+    counts = {"characters": 0, GAME: 0, SESSION: 0}
+
+    records = {}
+    for path in sorted(source.characters_dir.glob("*_character.json")):
+        name = path.name[: -len("_character.json")]
+        records[name] = path.read_text()
+    if records:
+        target.save_characters(records)
+    counts["characters"] = len(records)
+
+    for kind, suffix in ((GAME, "_game.json"), (SESSION, ".json")):
+        for path in sorted(source.transcript_dir(kind).glob(f"*{suffix}")):
+            name = path.name[: -len(suffix)]
+            target.save_messages(kind, name, source.load_messages(kind, name))
+            counts[kind] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import JSON characters, saved games and sessions into SQLite.")
+    parser.add_argument("--db", default=str(STORAGE_DB_PATH), help="SQLite database to write to.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    counts = migrate(JsonStorage(), SqliteStorage(args.db))
+    print(
+        f"Imported {counts['characters']} characters, {counts[GAME]} saved games "
+        f"and {counts[SESSION]} sessions into {args.db}"
+    )
+
+
+if __name__ == "__main__":
+    main()
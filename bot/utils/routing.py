@@ -0,0 +1,170 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from dotenv import load_dotenv
+
+from bot.utils.metrics import model_fallbacks
+
+load_dotenv()
+
+GPT_MODEL = os.getenv('GPT_MODEL')
+RAW_REASONING_EFFORT = (os.getenv('REASONING_EFFORT') or "").strip().lower()
+_DISABLED_REASONING_VALUES = {"", "none", "off", "disable", "disabled"}
+_ALLOWED_REASONING_EFFORTS = {"low", "medium", "high"}
+
+# Call sites that can each be pointed at their own model.
+NARRATION = "narration"
+SUMMARY = "summary"
+RULES = "rules"
+CHARACTER = "character"
+
+MODEL_CONTEXT_LIMITS = {
+    "gpt-5-nano": 32000,
+    "gpt-5": 400000,
+    "gpt-4o": 128000,
+    "gpt-5-mini": 400000
+}
+DEFAULT_CONTEXT_LIMIT = 50000
+# How long a route stays on its fallback model before the primary is tried again.
+ROUTE_FALLBACK_SECONDS = float(os.getenv('ROUTE_FALLBACK_SECONDS', '300'))
+# Weight of the newest call in the smoothed latency compared against the SLO.
+_LATENCY_WEIGHT = 0.3
+
+
+def resolve_context_limit(model_name: str | None) -> int:
+    if not model_name:
+        return DEFAULT_CONTEXT_LIMIT
+    model_key = model_name.lower()
+    for prefix, limit in MODEL_CONTEXT_LIMITS.items():
+        if model_key.startswith(prefix):
+            return limit
+    return DEFAULT_CONTEXT_LIMIT
+
+
+def resolve_reasoning_effort(raw_effort: str) -> Dict[str, str]:
+    if raw_effort in _ALLOWED_REASONING_EFFORTS:
+        return {"effort": raw_effort}
+    if raw_effort not in _DISABLED_REASONING_VALUES:
+        logging.warning("Ignoring unsupported REASONING_EFFORT value '%s'", raw_effort)
+    return {"effort": "minimal"}
+
+
+class Route:
+    __slots__ = ("name", "model", "reasoning", "fallback_model", "latency_slo", "fallback_reasoning")
+
+    def __init__(self, name, model, reasoning=None, fallback_model=None, latency_slo=None, fallback_reasoning=None):
+        self.name = name
+        self.model = model
+        self.reasoning = reasoning
+        self.fallback_model = fallback_model
+        self.latency_slo = latency_slo
+        self.fallback_reasoning = fallback_reasoning
+
+    @property
+    def context_limit(self):
+        # The route may be served by either model, so requests must fit the smaller window.
+        limits = [resolve_context_limit(self.model)]
+        if self.fallback_model:
+            limits.append(resolve_context_limit(self.fallback_model))
+        return min(limits)
+
+
+def route_from_env(name, inherit_reasoning=True):
+    """Build a route from ``<NAME>_MODEL``, ``<NAME>_REASONING_EFFORT``,
+    ``<NAME>_FALLBACK_MODEL``, ``<NAME>_FALLBACK_REASONING_EFFORT`` and
+    ``<NAME>_LATENCY_SLO_SECONDS``.
+
+    Unset values fall back to ``GPT_MODEL`` and ``REASONING_EFFORT``; with
+    ``inherit_reasoning=False`` the route sends no reasoning settings unless
+    its own variable is set. The fallback model never inherits reasoning
+    settings, since it is often a model that does not accept them.
+    """
+    prefix = name.upper()
+    raw_effort = os.getenv(f'{prefix}_REASONING_EFFORT')
+    if raw_effort is not None:
+        reasoning = resolve_reasoning_effort(raw_effort.strip().lower())
+    elif inherit_reasoning:
+        reasoning = resolve_reasoning_effort(RAW_REASONING_EFFORT)
+    else:
+        reasoning = None
+    latency_slo = os.getenv(f'{prefix}_LATENCY_SLO_SECONDS')
+    fallback_effort = os.getenv(f'{prefix}_FALLBACK_REASONING_EFFORT')
+    return Route(
+        name,
+        os.getenv(f'{prefix}_MODEL') or GPT_MODEL,
+        reasoning,
+        os.getenv(f'{prefix}_FALLBACK_MODEL') or None,
+        float(latency_slo) if latency_slo else None,
+        resolve_reasoning_effort(fallback_effort.strip().lower()) if fallback_effort is not None else None,
+    )
+
+
+class ModelRouter:
+    """Picks the model and reasoning effort for each call site.
+
+    A route with a fallback model and a latency SLO tracks the smoothed
+    latency of its primary model; once that exceeds the SLO, calls go to the
+    fallback for ``fallback_seconds`` before the primary is tried again.
+    """
+
+    def __init__(self, routes, fallback_seconds=ROUTE_FALLBACK_SECONDS):
+        self.routes = {route.name: route for route in routes}
+        self.fallback_seconds = fallback_seconds
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._fallback_until = {}
+
+    def route(self, name) -> Route:
+        return self.routes[name]
+
+    def select(self, name):
+        """Return ``(model, reasoning)`` to use for the next call on route ``name``."""
+        route = self.routes[name]
+        if self._on_fallback(route):
+            return route.fallback_model, route.fallback_reasoning
+        return route.model, route.reasoning
+
+    def _on_fallback(self, route):
+        until = self._fallback_until.get(route.name)
+        return until is not None and time.monotonic() < until
+
+    def observe(self, name, model, seconds):
+        route = self.routes[name]
+        if route.latency_slo is None or route.fallback_model is None or model != route.model:
+            return
+        with self._lock:
+            previous = self._latency.get(name)
+            latency = seconds if previous is None else previous + _LATENCY_WEIGHT * (seconds - previous)
+            if latency <= route.latency_slo:
+                self._latency[name] = latency
+                return
+            # Start from a clean slate when the primary is tried again.
+            self._latency.pop(name, None)
+            self._fallback_until[name] = time.monotonic() + self.fallback_seconds
+        model_fallbacks.inc(route=name)
+        logging.warning(
+            "Route %s: %s averaged %.2fs against a %.2fs SLO; using %s for %.0fs",
+            name, route.model, latency, route.latency_slo, route.fallback_model, self.fallback_seconds,
+        )
+
+    @contextmanager
+    def timed(self, name, model):
+        # Failed calls count too: a timeout is the slowest answer of all.
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, model, time.perf_counter() - started)
+
+
+router = ModelRouter([
+    route_from_env(NARRATION),
+    route_from_env(SUMMARY),
+    # Rulebook lookups historically ran without reasoning settings.
+    route_from_env(RULES, inherit_reasoning=False),
+    route_from_env(CHARACTER),
+])
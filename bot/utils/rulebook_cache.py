@@ -0,0 +1,180 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RULEBOOK_CACHE_SIZE = int(os.getenv('RULEBOOK_CACHE_SIZE', '512'))
+RULEBOOK_CACHE_TTL_SECONDS = float(os.getenv('RULEBOOK_CACHE_TTL_SECONDS', '86400'))
+# Cosine similarity needed to reuse the answer to a differently worded question; 0 disables it.
+RULEBOOK_CACHE_SIMILARITY = float(os.getenv('RULEBOOK_CACHE_SIMILARITY', '0'))
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it me my of on or "
+    "the their there this to what when where which who why will with you your".split()
+)
+
+
+def normalize_question(question):
+    return " ".join(_WORD_PATTERN.findall((question or "").lower()))
+
+
+def _terms(normalized):
+    words = [word for word in normalized.split() if word not in _STOPWORDS]
+    terms = {}
+    for word in words:
+        terms[word] = terms.get(word, 0) + 1
+    for first, second in zip(words, words[1:]):
+        bigram = f"{first} {second}"
+        terms[bigram] = terms.get(bigram, 0) + 1
+    norm = math.sqrt(sum(count * count for count in terms.values()))
+    return terms, norm
+
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "latency", "terms", "norm")
+
+    def __init__(self, answer, expires_at, latency, terms, norm):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.latency = latency
+        self.terms = terms
+        self.norm = norm
+
+
+class RulebookCache:
+    """Size- and TTL-bounded cache of rulebook answers.
+
+    Entries are keyed by a namespace (rulebook version and model) plus the
+    normalized question, so rebuilding or resyncing the rulebook or switching models never
+    serves stale answers. Near-duplicate questions are matched by cosine
+    similarity over word and bigram counts when ``similarity_threshold`` > 0.
+    """
+
+    def __init__(
+        self,
+        max_entries=RULEBOOK_CACHE_SIZE,
+        ttl_seconds=RULEBOOK_CACHE_TTL_SECONDS,
+        similarity_threshold=RULEBOOK_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._postings = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    def get(self, namespace, question):
+        normalized = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            key = (namespace, normalized)
+            entry = self._live_entry(key, now)
+            if entry is not None:
+                self.hits += 1
+            elif self.similarity_threshold > 0:
+                key, entry = self._nearest(namespace, normalized, now)
+                if entry is not None:
+                    self.near_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.latency_saved += entry.latency
+            return entry.answer
+
+    def put(self, namespace, question, answer, latency=0.0):
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        terms, norm = _terms(normalized)
+        entry = _Entry(answer, time.monotonic() + self.ttl_seconds, latency, terms, norm)
+        with self._lock:
+            key = (namespace, normalized)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for term in terms:
+                self._postings.setdefault((namespace, term), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_compute(self, namespace, question, compute):
+        answer = self.get(namespace, question)
+        if answer is not None:
+            return answer
+        started = time.perf_counter()
+        answer = compute()
+        self.put(namespace, question, answer, time.perf_counter() - started)
+        return answer
+
+    async def get_or_compute_async(self, namespace, question, compute):
+        answer = self.get(namespace, question)
+        if answer is not None:
+            return answer
+        started = time.perf_counter()
+        answer = await compute()
+        self.put(namespace, question, answer, time.perf_counter() - started)
+        return answer
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+
+    def _live_entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= now:
+            self._remove(key)
+            return None
+        return entry
+
+    def _nearest(self, namespace, normalized, now):
+        terms, norm = _terms(normalized)
+        if not norm:
+            return None, None
+        candidates = set()
+        for term in terms:
+            candidates.update(self._postings.get((namespace, term), ()))
+        best_key, best_entry, best_score = None, None, self.similarity_threshold
+        for key in candidates:
+            entry = self._live_entry(key, now)
+            if entry is None or not entry.norm:
+                continue
+            dot = sum(count * entry.terms.get(term, 0) for term, count in terms.items())
+            score = dot / (norm * entry.norm)
+            if score >= best_score:
+                best_key, best_entry, best_score = key, entry, score
+        return best_key, best_entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        namespace = key[0]
+        for term in entry.terms:
+            keys = self._postings.get((namespace, term))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[(namespace, term)]
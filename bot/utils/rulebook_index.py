@@ -0,0 +1,275 @@
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import heapq
+import hashlib
+import logging
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from dotenv import load_dotenv
+from PyPDF2 import PdfReader
+
+from bot.utils.manifest import file_fingerprint, page_digest
+
+load_dotenv()
+
+RULEBOOK_INDEX_DIR = Path(os.getenv('RULEBOOK_INDEX_DIR', 'dbs/documentation/rulebook_index'))
+EMBEDDINGS_CHUNK_SIZE = int(os.getenv('EMBEDDINGS_CHUNK_SIZE') or 1000)
+RULEBOOK_TOP_K = int(os.getenv('RULEBOOK_TOP_K', '5'))
+
+INDEX_VERSION = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_META_FILE = "index.json"
+_POSTINGS_FILE = "postings.bin"
+_CHUNKS_FILE = "chunks.bin"
+_PAGE_CACHE_FILE = "pages.json"
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class Passage(NamedTuple):
+    score: float
+    source: str
+    page: int
+    text: str
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def chunk_pages(pages: List[str], chunk_size: int = EMBEDDINGS_CHUNK_SIZE) -> List[tuple]:
+    """Pack each page's words into chunks of at most ``chunk_size`` characters.
+
+    Returns ``(page_number, text)`` tuples with 1-based page numbers.
+    """
+    chunks = []
+    for page_number, page_text in enumerate(pages, start=1):
+        current: List[str] = []
+        length = 0
+        for word in page_text.split():
+            if current and length + len(word) + 1 > chunk_size:
+                chunks.append((page_number, " ".join(current)))
+                current, length = [], 0
+            current.append(word)
+            length += len(word) + 1
+        if current:
+            chunks.append((page_number, " ".join(current)))
+    return chunks
+
+
+def build_index(sources: Dict[str, List[tuple]], index_dir=RULEBOOK_INDEX_DIR, chunk_size=EMBEDDINGS_CHUNK_SIZE):
+    """Write a BM25 index over ``{source_name: [(page, text), ...]}`` to ``index_dir``."""
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+
+    postings: Dict[str, List[tuple]] = {}
+    chunk_table = []
+    doc_lengths = []
+    chunk_bytes = bytearray()
+    for source, chunks in sources.items():
+        for page, text in chunks:
+            chunk_id = len(chunk_table)
+            encoded = text.encode("utf-8")
+            chunk_table.append([len(chunk_bytes), len(encoded), source, page])
+            chunk_bytes.extend(encoded)
+
+            term_counts: Dict[str, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                term_counts[token] = term_counts.get(token, 0) + 1
+            doc_lengths.append(len(tokens))
+            for term, count in term_counts.items():
+                postings.setdefault(term, []).append((chunk_id, count))
+
+    packed = array("I")
+    terms = {}
+    for term in sorted(postings):
+        entries = postings[term]
+        terms[term] = [len(packed) // 2, len(entries)]
+        for chunk_id, count in entries:
+            packed.append(chunk_id)
+            packed.append(count)
+
+    fingerprint = hashlib.sha256()
+    fingerprint.update(bytes(chunk_bytes))
+    fingerprint.update(json.dumps(chunk_table).encode("utf-8"))
+    meta = {
+        "version": INDEX_VERSION,
+        "fingerprint": fingerprint.hexdigest()[:16],
+        "chunk_size": chunk_size,
+        "byteorder": sys.byteorder,
+        "avg_doc_length": (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0,
+        "doc_lengths": doc_lengths,
+        "chunks": chunk_table,
+        "terms": terms,
+    }
+
+    # Data files first, metadata last: a reader never sees metadata pointing past the data.
+    _atomic_write_bytes(index_dir / _POSTINGS_FILE, packed.tobytes())
+    _atomic_write_bytes(index_dir / _CHUNKS_FILE, bytes(chunk_bytes))
+    _atomic_write_bytes(index_dir / _META_FILE, json.dumps(meta).encode("utf-8"))
+    logging.info("Rulebook index built with %d chunks and %d terms", len(chunk_table), len(terms))
+    return meta["fingerprint"]
+
+
+def build_index_from_pdfs(pdf_paths, manifest, index_dir=RULEBOOK_INDEX_DIR, chunk_size=EMBEDDINGS_CHUNK_SIZE):
+    """Bring the index up to date with ``pdf_paths``, re-extracting only changed pages.
+
+    ``manifest["local_index"]`` records each file's hash and per-page content
+    hashes; extracted page text is cached by page hash in the index directory.
+    Returns the index fingerprint and updates ``manifest`` in place.
+    """
+    index_dir = Path(index_dir)
+    section = manifest.setdefault("local_index", {})
+    previous_files = section.get("files", {})
+    fingerprints = {str(path): file_fingerprint(path, previous_files.get(str(path))) for path in pdf_paths}
+
+    unchanged = (
+        index_exists(index_dir)
+        and section.get("chunk_size") == chunk_size
+        and set(previous_files) == set(fingerprints)
+        and all(previous_files[key]["sha256"] == fingerprint["sha256"] for key, fingerprint in fingerprints.items())
+    )
+    if unchanged:
+        section["files"] = {key: {**previous_files[key], **fingerprint} for key, fingerprint in fingerprints.items()}
+        print("Rulebook index is up to date")
+        return section["fingerprint"]
+
+    page_cache = _load_page_cache(index_dir)
+    sources = {}
+    files = {}
+    for path in pdf_paths:
+        key = str(path)
+        previous = previous_files.get(key)
+        if previous and previous["sha256"] == fingerprints[key]["sha256"] and all(
+            digest in page_cache for digest in previous["pages"]
+        ):
+            page_digests = previous["pages"]
+        else:
+            page_digests = []
+            extracted = 0
+            for page in PdfReader(str(path)).pages:
+                digest = page_digest(page)
+                if digest not in page_cache:
+                    page_cache[digest] = page.extract_text() or ""
+                    extracted += 1
+                page_digests.append(digest)
+            print(f"Indexed {path}: {extracted} of {len(page_digests)} pages re-extracted")
+        sources[Path(path).name] = chunk_pages([page_cache[digest] for digest in page_digests], chunk_size)
+        files[key] = {**fingerprints[key], "pages": page_digests}
+
+    fingerprint = build_index(sources, index_dir, chunk_size)
+    used = {digest for entry in files.values() for digest in entry["pages"]}
+    _atomic_write_bytes(
+        index_dir / _PAGE_CACHE_FILE,
+        json.dumps({digest: text for digest, text in page_cache.items() if digest in used}).encode("utf-8"),
+    )
+    section.update(files=files, chunk_size=chunk_size, fingerprint=fingerprint)
+    return fingerprint
+
+
+def _load_page_cache(index_dir: Path) -> Dict[str, str]:
+    path = index_dir / _PAGE_CACHE_FILE
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text())
+    except ValueError:
+        return {}
+
+
+def _atomic_write_bytes(path: Path, data: bytes):
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _map_file(path: Path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class RulebookIndex:
+    """Read-only BM25 index whose postings and chunk text are memory-mapped."""
+
+    def __init__(self, index_dir=RULEBOOK_INDEX_DIR):
+        index_dir = Path(index_dir)
+        meta = json.loads((index_dir / _META_FILE).read_text())
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported rulebook index version {meta.get('version')}")
+        self.fingerprint = meta["fingerprint"]
+        self._terms = meta["terms"]
+        self._chunks = meta["chunks"]
+        self._doc_lengths = meta["doc_lengths"]
+        self._avg_doc_length = meta["avg_doc_length"] or 1.0
+        self._chunk_data = _map_file(index_dir / _CHUNKS_FILE)
+        postings_data = _map_file(index_dir / _POSTINGS_FILE)
+        if meta["byteorder"] == sys.byteorder:
+            self._postings = memoryview(postings_data).cast("I")
+        else:
+            self._postings = array("I", postings_data)
+            self._postings.byteswap()
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def search(self, query: str, k: int = RULEBOOK_TOP_K) -> List[Passage]:
+        document_count = len(self._chunks)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self._terms.get(term)
+            if entry is None:
+                continue
+            start, count = entry
+            idf = math.log(1 + (document_count - count + 0.5) / (count + 0.5))
+            for position in range(start * 2, (start + count) * 2, 2):
+                chunk_id = self._postings[position]
+                frequency = self._postings[position + 1]
+                length_norm = 1 - BM25_B + BM25_B * self._doc_lengths[chunk_id] / self._avg_doc_length
+                score = idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + score
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [self._passage(chunk_id, score) for chunk_id, score in best]
+
+    def _passage(self, chunk_id, score):
+        offset, length, source, page = self._chunks[chunk_id]
+        text = bytes(self._chunk_data[offset:offset + length]).decode("utf-8")
+        return Passage(score, source, page, text)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_rulebook_index(index_dir=RULEBOOK_INDEX_DIR) -> RulebookIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = RulebookIndex(index_dir)
+    return _index
+
+
+def reset_rulebook_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def index_exists(index_dir=RULEBOOK_INDEX_DIR) -> bool:
+    return (Path(index_dir) / _META_FILE).exists()
+
+
+def format_passages(passages: List[Passage]) -> str:
+    return "\n\n".join(f"[{passage.source}, page {passage.page}]\n{passage.text}" for passage in passages)
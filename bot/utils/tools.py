@@ -0,0 +1,193 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List
+
+from bot.utils.metrics import tool_seconds
+
+_JSON_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "array": (list,),
+    "object": (dict,),
+}
+
+
+class ToolError(Exception):
+    """Raised by a handler to send a structured error back to the model."""
+
+    def __init__(self, message, error_type="tool_error"):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+def compile_validator(schema: Dict[str, Any], path: str = "arguments") -> Callable[[Any], List[str]]:
+    """Turn a JSON schema into a function returning a list of error messages.
+
+    Supports the subset the tool schemas use: ``type``, ``enum``,
+    ``properties``/``required`` on objects and ``items`` on arrays. Nested
+    validators are built once, here, rather than on every call.
+    """
+    expected_type = schema.get("type")
+    python_types = _JSON_TYPES.get(expected_type)
+    allowed = schema.get("enum")
+    allowed_set = frozenset(allowed) if allowed is not None else None
+    properties = {
+        name: compile_validator(subschema, f"{path}.{name}")
+        for name, subschema in schema.get("properties", {}).items()
+    }
+    required = tuple(schema.get("required", ()))
+    validate_item = compile_validator(schema["items"], f"{path}[]") if "items" in schema else None
+
+    def validate(value):
+        if python_types is not None and (
+            not isinstance(value, python_types)
+            # bool is a subclass of int, but JSON keeps them apart.
+            or (isinstance(value, bool) and expected_type != "boolean")
+        ):
+            return [f"{path} must be of type {expected_type}"]
+        if allowed_set is not None and value not in allowed_set:
+            return [f"{path} must be one of {allowed}"]
+        errors = []
+        if expected_type == "object" and (properties or required):
+            for name in required:
+                if value.get(name) is None:
+                    errors.append(f"{path}.{name} is required")
+            for name, item in value.items():
+                if item is None:
+                    continue
+                validate_property = properties.get(name)
+                if validate_property is None:
+                    errors.append(f"{path}.{name} is not a recognised argument")
+                else:
+                    errors.extend(validate_property(item))
+        elif validate_item is not None:
+            for item in value:
+                errors.extend(validate_item(item))
+        return errors
+
+    return validate
+
+
+def tool_error(name, error_type, message, details=None):
+    error = {"type": error_type, "tool": name, "message": message}
+    if details:
+        error["details"] = details
+    return json.dumps({"error": error})
+
+
+class Tool:
+    __slots__ = (
+        "name", "schema", "handler", "async_handler", "validate", "parameter_names", "resources", "needs_conversation"
+    )
+
+    def __init__(self, name, schema, handler, async_handler, resources, needs_conversation):
+        self.name = name
+        self.schema = schema
+        self.handler = handler
+        self.async_handler = async_handler
+        parameters = schema.get("parameters", {"type": "object"})
+        self.validate = compile_validator(parameters)
+        self.parameter_names = tuple(parameters.get("properties", {}))
+        self.resources = resources
+        self.needs_conversation = needs_conversation
+
+
+class ToolRegistry:
+    """Name -> tool table built once at import, used for dispatch and lane planning.
+
+    Each tool pairs its JSON schema from ``FUNCTIONS`` with a precompiled
+    argument validator and its handler. Bad arguments, unknown tools and
+    handler failures come back as a JSON ``{"error": ...}`` payload the model
+    can read and correct, rather than as exceptions that end the turn.
+    """
+
+    def __init__(self, functions):
+        self.functions = functions
+        self._schemas = {function["name"]: function for function in functions}
+        self._tools: Dict[str, Tool] = {}
+
+    def register(self, name, handler, async_handler=None, resources=None, needs_conversation=False):
+        """Register ``handler`` for the schema called ``name``.
+
+        ``resources(arguments)`` returns the resources a call touches; calls
+        sharing one run one after another. ``needs_conversation`` handlers get
+        the conversation as their first positional argument.
+        """
+        schema = self._schemas.get(name)
+        if schema is None:
+            raise KeyError(f"No schema named {name!r} in FUNCTIONS")
+        self._tools[name] = Tool(name, schema, handler, async_handler, resources, needs_conversation)
+        return handler
+
+    def parse(self, call):
+        """Return ``(tool, arguments, error)`` for a function call from the model.
+
+        Each call is parsed once; the result is what :meth:`resources` and
+        :meth:`execute` take.
+        """
+        tool = self._tools.get(call["name"])
+        if tool is None:
+            return None, None, tool_error(call["name"], "unknown_tool", f"There is no tool named {call['name']!r}.")
+        try:
+            arguments = json.loads(call.get("arguments") or "{}")
+        except json.JSONDecodeError as exc:
+            return tool, None, tool_error(tool.name, "invalid_arguments", f"Arguments are not valid JSON: {exc}")
+        if not isinstance(arguments, dict):
+            return tool, None, tool_error(tool.name, "invalid_arguments", "Arguments must be a JSON object.")
+        errors = tool.validate(arguments)
+        if errors:
+            return tool, None, tool_error(tool.name, "invalid_arguments", "Arguments do not match the schema.", errors)
+        # Optional parameters the model left out are passed as None.
+        return tool, {name: arguments.get(name) for name in tool.parameter_names}, None
+
+    def resources(self, parsed):
+        tool, arguments, error = parsed
+        if error is not None or tool.resources is None:
+            return set()
+        return tool.resources(arguments)
+
+    def execute(self, parsed, conversation=None):
+        tool, arguments, error = parsed
+        if error is not None:
+            tool_seconds.observe(0.0, tool="unknown" if tool is None else tool.name, outcome="invalid")
+            return error
+        args = (conversation,) if tool.needs_conversation else ()
+        started = time.perf_counter()
+        try:
+            result = tool.handler(*args, **arguments)
+        except Exception as exc:  # noqa: BLE001 - reported to the model, which can retry or move on
+            tool_seconds.observe(time.perf_counter() - started, tool=tool.name, outcome="error")
+            return self._failure(tool, exc)
+        tool_seconds.observe(time.perf_counter() - started, tool=tool.name, outcome="ok")
+        return result
+
+    async def execute_async(self, parsed, conversation=None):
+        tool, arguments, error = parsed
+        if error is not None:
+            tool_seconds.observe(0.0, tool="unknown" if tool is None else tool.name, outcome="invalid")
+            return error
+        args = (conversation,) if tool.needs_conversation else ()
+        started = time.perf_counter()
+        try:
+            if tool.async_handler is not None:
+                result = await tool.async_handler(*args, **arguments)
+            else:
+                result = await asyncio.to_thread(tool.handler, *args, **arguments)
+        except Exception as exc:  # noqa: BLE001 - reported to the model, which can retry or move on
+            tool_seconds.observe(time.perf_counter() - started, tool=tool.name, outcome="error")
+            return self._failure(tool, exc)
+        tool_seconds.observe(time.perf_counter() - started, tool=tool.name, outcome="ok")
+        return result
+
+    def _failure(self, tool, exc):
+        if isinstance(exc, ToolError):
+            return tool_error(tool.name, exc.error_type, str(exc))
+        if isinstance(exc, LookupError):
+            # KeyError's str() adds quotes; the message itself reads better.
+            return tool_error(tool.name, "not_found", str(exc.args[0]) if exc.args else str(exc))
+        logging.exception("Tool %s failed", tool.name)
+        return tool_error(tool.name, "tool_failed", f"{type(exc).__name__}: {exc}")
@@ -5,17 +5,60 @@ import ChatWindow from './components/ChatWindow';
 import Composer from './components/Composer';
 import axios from 'axios';
 
+const SESSION_ID = `table-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
+// Reads the Server-Sent Events emitted by /chat/stream and hands each text delta to onDelta.
+async function streamReply(text, onDelta) {
+  const response = await fetch('http://localhost:8000/chat/stream', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ user_input: text, session_id: SESSION_ID }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Stream request failed with status ${response.status}`);
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      const chunk = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+      const data = chunk
+        .split('\n')
+        .filter((line) => line.startsWith('data:'))
+        .map((line) => line.slice(5).trim())
+        .join('\n');
+      if (!data) continue;
+      const event = JSON.parse(data);
+      if (event.type === 'delta') onDelta(event.text);
+      if (event.type === 'error') throw new Error(event.message);
+    }
+  }
+}
+
 function App() {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
   const [sending, setSending] = useState(false);
   const inputRef = useRef(null);
 
-  const pushMessage = (msg) => setMessages((prev) => [...prev, { id: `${Date.now()}-${Math.random()}`, ...msg }]);
+  const pushMessage = (msg) => {
+    const id = `${Date.now()}-${Math.random()}`;
+    setMessages((prev) => [...prev, { id, ...msg }]);
+    return id;
+  };
+  const appendToMessage = (id, text) =>
+    setMessages((prev) => prev.map((msg) => (msg.id === id ? { ...msg, content: msg.content + text } : msg)));
   const handleClear = async () => {
     setMessages([]);
     try {
-      await axios.post('http://localhost:8000/chat/reset');
+      await axios.post('http://localhost:8000/chat/reset', { session_id: SESSION_ID });
     } catch (err) {
       console.warn('Failed to reset DM context:', err);
     }
@@ -43,15 +86,23 @@ function App() {
     // Add my message
     pushMessage({ role: 'me', content: text, ts: Date.now() });
 
+    let dmId = null;
     try {
-      const response = await axios.post('http://localhost:8000/chat', {
-        user_input: text,
+      await streamReply(text, (delta) => {
+        if (dmId === null) {
+          dmId = pushMessage({ role: 'dm', content: delta, ts: Date.now() });
+        } else {
+          appendToMessage(dmId, delta);
+        }
       });
-      const dmText = response?.data?.response ?? '';
-      pushMessage({ role: 'dm', content: dmText, ts: Date.now() });
     } catch (err) {
       console.error('Failed to get response from bot:', err);
-      pushMessage({ role: 'dm', content: 'The DM is silent… (error)', ts: Date.now() });
+      if (dmId === null) {
+        pushMessage({ role: 'dm', content: 'The DM is silent… (error)', ts: Date.now() });
+      } else {
+        // The reply broke off part-way; mark it so the truncation is not mistaken for the full answer.
+        appendToMessage(dmId, '\n\n… (the DM was interrupted: error)');
+      }
     } finally {
       setSending(false);
       // Ensure focus returns to the textarea after send completes